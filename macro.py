@@ -1,119 +1,271 @@
 import os
+import glob
+import json
+import hashlib
+import numpy as np
 import pandas as pd
-from typing import Tuple
+from functools import lru_cache
+from typing import Iterator, Optional, Tuple
+
+# Prefer the Rust-backed calamine reader; openpyxl stays as the fallback engine
+try:
+    import python_calamine  # noqa: F401
+    _EXCEL_ENGINE = "calamine"
+except ImportError:
+    _EXCEL_ENGINE = "openpyxl"
+
+# xlsxwriter serializes much faster than openpyxl; it is optional for the same reason
+try:
+    import xlsxwriter  # noqa: F401
+    _EXCEL_WRITER = "xlsxwriter"
+    _EXCEL_WRITER_KWARGS = {"options": {"strings_to_urls": False}}
+except ImportError:
+    _EXCEL_WRITER = "openpyxl"
+    _EXCEL_WRITER_KWARGS = {}
+
+# Arrow-backed strings keep text in contiguous buffers and make the .str/.isin/.map passes cheaper
+try:
+    import pyarrow  # noqa: F401
+    _STRING_DTYPE = "string[pyarrow]"
+except ImportError:
+    _STRING_DTYPE = None
+
+# CSV reports are streamed in chunks of this many rows to keep peak memory bounded
+_CSV_CHUNK_ROWS = 200_000
+
+
+def _as_strings(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert the all-text frames we ingest to Arrow-backed strings when pyarrow is available."""
+    return df.astype(_STRING_DTYPE) if _STRING_DTYPE else df
 
 
 def _read_raw(path: str) -> pd.DataFrame:
     """Load the Raw sheet (or CSV) exactly once."""
     if path.lower().endswith(".csv"):
-        return pd.read_csv(path, dtype=str, keep_default_na=False)
+        return _as_strings(pd.read_csv(path, dtype=str, keep_default_na=False))
     for sheet in ("Raw", 0):
         try:
-            return pd.read_excel(path, sheet_name=sheet, dtype=str, keep_default_na=False, engine="openpyxl")
+            return _as_strings(pd.read_excel(path, sheet_name=sheet, dtype=str, keep_default_na=False, engine=_EXCEL_ENGINE))
         except ValueError:
             continue
     raise ValueError("Could not load Raw sheet from input file")
 
 
-def _read_help(path: str) -> pd.DataFrame:
-    return pd.read_excel(path, sheet_name="Help", dtype=str, keep_default_na=False, engine="openpyxl")
+def _iter_raw(path: str) -> Iterator[pd.DataFrame]:
+    """Yield the Raw data in chunks (CSV is streamed, Excel sheets load in one piece)."""
+    if path.lower().endswith(".csv"):
+        for chunk in pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=_CSV_CHUNK_ROWS):
+            yield _as_strings(chunk)
+    else:
+        yield _read_raw(path)
 
 
-def audentes_verification_cleaned(raw_path: str, help_path: str, output_path: str) -> Tuple[pd.DataFrame, dict]:
-    """Python translation of Audentes_Verification_Cleaned VBA macro."""
+# ---------- Help sheet cache ----------
 
-    print("Loading raw and help data...")
-    df_raw = _read_raw(raw_path)
-    df_help = _read_help(help_path)
+# Bump whenever the cached Help data changes shape or normalization; older cache files are then ignored
+_HELP_CACHE_VERSION = 2
+# Files left behind by earlier cache formats, removed whenever the cache is rewritten
+_STALE_HELP_CACHE_GLOBS = ("help_cache_*.pkl", "help_raw_cache_*.pkl", "help_cache_v*.json")
 
-    df_raw = df_raw.fillna("")
-    df_help = df_help.fillna("")
 
-    # Column headers from help sheet (matches VBA B1, D1, E1)
-    provider_col = df_help.columns[0]  # Help column C1
-    state_col = df_help.columns[1]     # Help column C2
-    visit_type_col = df_help.columns[2]  # Help column C3
-    workable_col_help = df_help.columns[3]  # Help column C4
-    primary_ins_help = df_help.columns[4]  # Help column C5
+def _help_cache_file(cache_dir: str) -> str:
+    return os.path.join(cache_dir, f"help_cache_v{_HELP_CACHE_VERSION}.json")
 
-    # Copy raw so we do not mutate original
-    df = df_raw.copy()
 
-    # Insert helper columns A / B / C analogous to Excel macro
-    print("Creating helper columns (Appointment State, Workable Status, HelpCheck)...")
-    provider_map = {
-        str(k).strip().upper(): str(v).strip()
-        for k, v in zip(df_help[provider_col], df_help[state_col])
-        if str(k).strip()
-    }
-    visit_map = {
-        str(k).strip().upper(): str(v).strip()
-        for k, v in zip(df_help[visit_type_col], df_help[workable_col_help])
-        if str(k).strip()
-    }
-    # HelpCheck simply mirrors the primary insurance names (used for exclusions)
-    helpcheck_map = {
-        str(k).strip().upper(): str(k).strip() for k in df_help[primary_ins_help] if str(k).strip()
-    }
+@lru_cache(maxsize=8)
+def _template_digest_cached(path: str, size: int, mtime_ns: int) -> str:
+    with open(path, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def _template_digest(path: str) -> str:
+    """md5 of the template's content, hashed once per (path, size, mtime) in this process."""
+    st = os.stat(path)
+    return _template_digest_cached(os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+
+def load_help_cache(template_path: str, cache_dir: Optional[str], section: str):
+    """Return the cached `section` for this template's content, or None on a miss.
+
+    One JSON file per cache_dir holds the latest template only; macro.py stores the
+    raw Help sheet under "raw" and process_data its parsed lookups under "lookups".
+    """
+    if not cache_dir or not template_path or not os.path.isfile(template_path):
+        return None
+    cache_path = _help_cache_file(cache_dir)
+    if not os.path.isfile(cache_path):
+        return None
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except Exception as e:
+        print(f"Warning: Ignoring unreadable Help cache {cache_path}: {e}")
+        return None
+    if entry.get("version") != _HELP_CACHE_VERSION or entry.get("template") != _template_digest(template_path):
+        return None
+    return entry.get("sections", {}).get(section)
+
+
+def save_help_cache(template_path: str, cache_dir: Optional[str], section: str, data) -> None:
+    """Store `section` (plain JSON data) for this template, replacing any other template's entry."""
+    if not cache_dir or not template_path or not os.path.isfile(template_path):
+        return
+    cache_path = _help_cache_file(cache_dir)
+    digest = _template_digest(template_path)
+    sections = {}
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        if entry.get("version") == _HELP_CACHE_VERSION and entry.get("template") == digest:
+            sections = entry.get("sections", {})
+    except Exception:
+        pass
+    sections[section] = data
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": _HELP_CACHE_VERSION, "template": digest, "sections": sections}, f)
+        os.replace(tmp_path, cache_path)
+        for pattern in _STALE_HELP_CACHE_GLOBS:
+            for stale in glob.glob(os.path.join(cache_dir, pattern)):
+                if stale != cache_path:
+                    os.remove(stale)
+    except Exception as e:
+        print(f"Warning: Could not write Help cache {cache_path}: {e}")
+
+
+def frame_to_json(df: pd.DataFrame) -> dict:
+    """All-text frame -> {"columns", "data"} for the Help cache (missing values become null)."""
+    values = df.astype(object).where(df.notna(), None)
+    return {"columns": [str(c) for c in df.columns], "data": values.to_numpy().tolist()}
+
+
+def frame_from_json(data: dict) -> pd.DataFrame:
+    return pd.DataFrame(data["data"], columns=data["columns"], dtype=object)
 
+
+def _read_help(path: str, cache_dir: Optional[str] = None) -> pd.DataFrame:
+    """Load the Help sheet, reusing the copy in cache_dir's Help cache when the template content is unchanged."""
+    cached = load_help_cache(path, cache_dir, "raw")
+    if cached is not None:
+        return _as_strings(frame_from_json(cached))
+
+    df_help = _as_strings(pd.read_excel(path, sheet_name="Help", dtype=str, keep_default_na=False, engine=_EXCEL_ENGINE))
+    save_help_cache(path, cache_dir, "raw", frame_to_json(df_help))
+    return df_help
+
+
+def _help_map(keys: pd.Series, values: pd.Series) -> dict:
+    """Build an upper-cased key -> stripped value lookup from two Help columns, skipping blank keys."""
+    k_arr = keys.astype(str).str.strip().str.upper().to_numpy()
+    v_arr = values.astype(str).str.strip().to_numpy()
+    keep = k_arr != ""
+    return dict(zip(k_arr[keep], v_arr[keep]))
+
+
+def _map_categories(values: pd.Series, lookup) -> np.ndarray:
+    """Apply `lookup` once per distinct value and broadcast the results back via category codes."""
+    cat = pd.Categorical(values.astype(str))
+    mapped = np.array([lookup(c) for c in cat.categories], dtype=object)
+    return mapped[cat.codes]
+
+
+def _clean_frame(df: pd.DataFrame, provider_map: dict, visit_map: dict, helpcheck_map: dict) -> Tuple[pd.DataFrame, dict]:
+    """Insert the helper columns into `df` and drop rows failing the macro filters."""
+    # Lookup columns repeat a handful of values, so resolve each distinct value once
     df.insert(
         0,
         "Appointment State",
-        df["Appointment Provider Name"]
-        .astype(str)
-        .map(lambda x: provider_map.get(x.strip().upper(), "")),
+        _map_categories(df["Appointment Provider Name"], lambda x: provider_map.get(x.strip().upper(), "")),
     )
     df.insert(
         1,
         "Workable Status",
-        df.get("Visit Type", "")
-        .astype(str)
-        .map(lambda x: visit_map.get(x.strip().upper(), "")),
+        _map_categories(df.get("Visit Type", ""), lambda x: visit_map.get(x.strip().upper(), "")),
     )
     df.insert(
         2,
         "HelpCheck",
-        df.get("Primary Insurance Name", "")
-        .astype(str)
-        .map(lambda x: helpcheck_map.get(x.strip().upper(), x.strip())),
+        _map_categories(df.get("Primary Insurance Name", ""), lambda x: helpcheck_map.get(x.strip().upper(), x.strip())),
     )
 
-    # Track counts for logging
-    initial_rows = len(df)
+    # Lookup results are already stripped strings, so the masks reuse them without another pass
+    state_norm = df["Appointment State"]
+    helpcheck_norm = df["HelpCheck"]
 
-    print("Applying filter: remove rows with missing Appointment State (#N/A)...")
-    mask_state = df["Appointment State"].astype(str).str.strip().isin(["", "#N/A"])
-    removed_state = int(mask_state.sum())
-    df = df[~mask_state].reset_index(drop=True)
+    mask_state = state_norm.isin(["", "#N/A"])
+    # Workable sentinels are resolved on the categories, leaving an integer test over the codes
+    work_cat = pd.Categorical(df["Workable Status"])
+    work_ids = np.flatnonzero(work_cat.categories.str.upper().isin(["N", "#N/A"]))
+    mask_workable = np.isin(work_cat.codes, work_ids)
+    exclude_codes = {"L105", "L107", "L109C", "L109Q", "L109W"}
+    # Exclusion test runs on the few distinct HelpCheck values, then a single integer scan over the codes
+    helpcheck_cat = pd.Categorical(helpcheck_norm)
+    excl_ids = np.flatnonzero(helpcheck_cat.categories.isin(list(exclude_codes)))
+    mask_codes = np.isin(helpcheck_cat.codes, excl_ids)
+
+    # Counts keep the sequential semantics: each filter only counts rows the earlier ones kept
+    counts = {
+        "initial": len(df),
+        "removed_state": int(mask_state.sum()),
+        "removed_workable": int((mask_workable & ~mask_state).sum()),
+        "removed_codes": int((mask_codes & ~(mask_state | mask_workable)).sum()),
+    }
 
-    print("Applying filter: remove rows with Workable Status N or #N/A...")
-    mask_workable = df["Workable Status"].astype(str).str.strip().str.upper().isin(["N", "#N/A"])
-    removed_workable = int(mask_workable.sum())
-    df = df[~mask_workable].reset_index(drop=True)
+    # Single slice instead of three successive copies of the frame
+    keep = ~(mask_state | mask_workable | mask_codes)
+    return df.loc[keep].reset_index(drop=True), counts
 
-    print("Applying filter: remove HelpCheck codes L105/L107/L109C/L109Q/L109W...")
-    exclude_codes = {"L105", "L107", "L109C", "L109Q", "L109W"}
-    mask_codes = df["HelpCheck"].astype(str).str.strip().isin(exclude_codes)
-    removed_codes = int(mask_codes.sum())
-    df = df[~mask_codes].reset_index(drop=True)
+
+def audentes_verification_cleaned(raw_path: str, help_path: str, output_path: Optional[str], cache_dir: Optional[str] = None) -> Tuple[pd.DataFrame, dict]:
+    """Python translation of Audentes_Verification_Cleaned VBA macro.
+
+    The cleaned frame is returned for in-memory hand-off; it is only written to
+    output_path when one is given.
+    """
+
+    print("Loading raw and help data...")
+    df_help = _read_help(help_path, cache_dir=cache_dir)
+    df_help = df_help.fillna("")
+
+    # Column headers from help sheet (matches VBA B1, D1, E1)
+    provider_col = df_help.columns[0]  # Help column C1
+    state_col = df_help.columns[1]     # Help column C2
+    visit_type_col = df_help.columns[2]  # Help column C3
+    workable_col_help = df_help.columns[3]  # Help column C4
+    primary_ins_help = df_help.columns[4]  # Help column C5
+
+    provider_map = _help_map(df_help[provider_col], df_help[state_col])
+    visit_map = _help_map(df_help[visit_type_col], df_help[workable_col_help])
+    # HelpCheck simply mirrors the primary insurance names (used for exclusions)
+    helpcheck_map = _help_map(df_help[primary_ins_help], df_help[primary_ins_help])
+
+    # Insert helper columns A / B / C analogous to Excel macro, then filter.
+    # CSV input is processed chunk by chunk so only the surviving rows are kept in memory.
+    print("Creating helper columns (Appointment State, Workable Status, HelpCheck)...")
+    print("Applying filters: Appointment State (#N/A), Workable Status (N/#N/A), HelpCheck codes L105/L107/L109C/L109Q/L109W...")
+    parts = []
+    totals = {"initial": 0, "removed_state": 0, "removed_workable": 0, "removed_codes": 0}
+    for chunk in _iter_raw(raw_path):
+        cleaned, counts = _clean_frame(chunk.fillna(""), provider_map, visit_map, helpcheck_map)
+        parts.append(cleaned)
+        for key, value in counts.items():
+            totals[key] += value
+    df = pd.concat(parts, ignore_index=True, copy=False) if len(parts) > 1 else parts[0]
 
     final_rows = len(df)
     print("Macro filtering summary:")
-    print(f"  Initial rows: {initial_rows}")
-    print(f"  Removed (Appointment State missing/#N/A): {removed_state}")
-    print(f"  Removed (Workable Status N/#N/A): {removed_workable}")
-    print(f"  Removed (HelpCheck exclusion codes): {removed_codes}")
+    print(f"  Initial rows: {totals['initial']}")
+    print(f"  Removed (Appointment State missing/#N/A): {totals['removed_state']}")
+    print(f"  Removed (Workable Status N/#N/A): {totals['removed_workable']}")
+    print(f"  Removed (HelpCheck exclusion codes): {totals['removed_codes']}")
     print(f"  Final remaining rows: {final_rows}")
 
     # Save cleaned output
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    df.to_excel(output_path, index=False, engine="openpyxl")
-    print(f"Cleaned file saved to: {output_path}")
-
-    return df, {
-        "initial": initial_rows,
-        "removed_state": removed_state,
-        "removed_workable": removed_workable,
-        "removed_codes": removed_codes,
-        "final": final_rows,
-    }
+    if output_path:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        df.to_excel(output_path, index=False, engine=_EXCEL_WRITER, engine_kwargs=_EXCEL_WRITER_KWARGS)
+        print(f"Cleaned file saved to: {output_path}")
+
+    return df, {**totals, "final": final_rows}
@@ -1,11 +1,13 @@
 import os
 import json
+import logging
 import shutil
 import sys
 import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from datetime import datetime
+from functools import lru_cache
 
 # Import processing and upload modules
 try:
@@ -19,17 +21,28 @@ except ImportError as e:
 
 def _ensure_dirs(cfg: dict) -> tuple[str, str, str]:
     """Create input, output, and log directories if they don't exist."""
-    base = os.getcwd()
-    in_dir = os.path.join(base, cfg.get("input_folder", "inputs"))
-    out_dir = os.path.join(base, cfg.get("output_folder", "outputs"))
-    log_dir = os.path.join(base, cfg.get("log_folder", "logs"))
+    return _ensure_dirs_cached(
+        os.getcwd(),
+        cfg.get("input_folder", "inputs"),
+        cfg.get("output_folder", "outputs"),
+        cfg.get("log_folder", "logs"),
+    )
+
+
+@lru_cache(maxsize=8)
+def _ensure_dirs_cached(base: str, in_name: str, out_name: str, log_name: str) -> tuple[str, str, str]:
+    """Create the directories once per (cwd, folder names); repeat calls skip the mkdir syscalls."""
+    in_dir = os.path.join(base, in_name)
+    out_dir = os.path.join(base, out_name)
+    log_dir = os.path.join(base, log_name)
     for d in (in_dir, out_dir, log_dir):
         os.makedirs(d, exist_ok=True)
     return in_dir, out_dir, log_dir
 
 
+@lru_cache(maxsize=1)
 def _load_config() -> dict:
-    """Load configuration from config.json."""
+    """Load configuration from config.json (read once per process)."""
     cfg_path = os.path.join(os.getcwd(), "config.json")
     try:
         with open(cfg_path, "r", encoding="utf-8") as f:
@@ -38,21 +51,33 @@ def _load_config() -> dict:
         return {}
 
 
-_current_log_path = None
+# One logger per process; each run points it at its own log file
+logger = logging.getLogger("audentes")
+logger.setLevel(logging.INFO)
+logger.propagate = False
 
-def _log(message: str, log_path: str = None) -> None:
-    """Write message to log file with timestamp."""
-    global _current_log_path
-    if log_path:
-        _current_log_path = log_path
-    elif _current_log_path is None:
-        cfg = _load_config()
-        _, _, log_dir = _ensure_dirs(cfg)
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        _current_log_path = os.path.join(log_dir, f"run_{ts}.txt")
-    with open(_current_log_path, "a", encoding="utf-8") as f:
-        log_ts = datetime.now().strftime("%H:%M:%S")
-        f.write(f"[{log_ts}] {message}\n")
+
+def _setup_logging(log_path: str) -> None:
+    """Route the run logger to log_path, keeping a single open handle for the whole run."""
+    _close_logging()
+    handler = logging.FileHandler(log_path, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("[%(asctime)s] %(message)s", datefmt="%H:%M:%S"))
+    logger.addHandler(handler)
+
+
+def _close_logging() -> None:
+    """Detach and close the current run's log handler(s)."""
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+
+def _default_log_path() -> str:
+    """Timestamped log path in the configured log folder (used when a run fails before logging starts)."""
+    cfg = _load_config()
+    _, _, log_dir = _ensure_dirs(cfg)
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(log_dir, f"run_{ts}.txt")
 
 
 def run_process_async(ecw_path: str, template_path: str, escalation_path: str, status_label: tk.Label, root: tk.Tk) -> None:
@@ -63,9 +88,10 @@ def run_process_async(ecw_path: str, template_path: str, escalation_path: str, s
 
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
         run_log_path = os.path.join(log_dir, f"run_{ts}.txt")
-        _log("=" * 60, log_path=run_log_path)
-        _log("Audentes Verification Automation Tool - Run Started", log_path=run_log_path)
-        _log("=" * 60, log_path=run_log_path)
+        _setup_logging(run_log_path)
+        logger.info("=" * 60)
+        logger.info("Audentes Verification Automation Tool - Run Started")
+        logger.info("=" * 60)
 
         # Step 1: Save files to inputs/
         status_label.config(text="Saving files to inputs/ folder...")
@@ -74,8 +100,8 @@ def run_process_async(ecw_path: str, template_path: str, escalation_path: str, s
         tpl_copy = os.path.join(in_dir, f"Template_{ts}{os.path.splitext(template_path)[1]}")
         shutil.copy2(ecw_path, ecw_copy)
         shutil.copy2(template_path, tpl_copy)
-        _log(f"eCW file loaded: {os.path.basename(ecw_copy)}", log_path=run_log_path)
-        _log(f"Template file loaded: {os.path.basename(tpl_copy)}", log_path=run_log_path)
+        logger.info(f"eCW file loaded: {os.path.basename(ecw_copy)}")
+        logger.info(f"Template file loaded: {os.path.basename(tpl_copy)}")
 
         escalation_copy = None
         if escalation_path and os.path.isfile(escalation_path):
@@ -83,21 +109,27 @@ def run_process_async(ecw_path: str, template_path: str, escalation_path: str, s
                 esc_ext = os.path.splitext(escalation_path)[1] or ".csv"
                 escalation_copy = os.path.join(in_dir, f"Escalation_{ts}{esc_ext}")
                 shutil.copy2(escalation_path, escalation_copy)
-                _log(f"Escalation tracker loaded: {os.path.basename(escalation_copy)}", log_path=run_log_path)
+                logger.info(f"Escalation tracker loaded: {os.path.basename(escalation_copy)}")
             except Exception as e:
                 escalation_copy = None
-                _log(f"Warning: Could not copy escalation tracker: {e}", log_path=run_log_path)
+                logger.warning(f"Warning: Could not copy escalation tracker: {e}")
 
         # === NEW STEP 2: Run Macro Cleaning ===
         try:
             status_label.config(text="Running VBA macro cleanup step...")
             root.update()
-            cleaned_file = os.path.join(out_dir, f"Audentes_Verification_Cleaned_{ts}.xlsx")
-            audentes_verification_cleaned(ecw_copy, tpl_copy, cleaned_file)
-            _log(f"Macro cleanup complete: {os.path.basename(cleaned_file)}", log_path=run_log_path)
+            # The cleaned frame is handed to run_pipeline in memory; the .xlsx copy is optional
+            cleaned_file = None
+            if cfg.get("save_intermediate", False):
+                cleaned_file = os.path.join(out_dir, f"Audentes_Verification_Cleaned_{ts}.xlsx")
+            cleaned_df, _ = audentes_verification_cleaned(ecw_copy, tpl_copy, cleaned_file, cache_dir=log_dir)
+            if cleaned_file:
+                logger.info(f"Macro cleanup complete: {os.path.basename(cleaned_file)}")
+            else:
+                logger.info(f"Macro cleanup complete: {len(cleaned_df)} rows")
         except Exception as e:
             error_msg = f"Macro cleanup failed: {str(e)}"
-            _log(f"ERROR: {error_msg}", log_path=run_log_path)
+            logger.error(f"ERROR: {error_msg}")
             messagebox.showerror("Macro Step Error", f"❌ {error_msg}\n\nCheck logs for details.")
             status_label.config(text="Macro cleanup failed. See logs.")
             return
@@ -109,18 +141,18 @@ def run_process_async(ecw_path: str, template_path: str, escalation_path: str, s
             # All filtering (Visit Status, WC, Escalation) is now handled inside run_pipeline
             escalation_input = escalation_copy or (escalation_path if escalation_path and os.path.isfile(escalation_path) else None)
             if escalation_input:
-                _log(f"Using escalation tracker: {escalation_input}", log_path=run_log_path)
+                logger.info(f"Using escalation tracker: {escalation_input}")
             else:
-                _log("No escalation tracker provided; skipping escalation filter", log_path=run_log_path)
+                logger.info("No escalation tracker provided; skipping escalation filter")
             
-            pipeline_result = run_pipeline(cleaned_file, tpl_copy, out_dir, escalation_file_path=escalation_input, log_path=run_log_path)
+            pipeline_result = run_pipeline(cleaned_file, tpl_copy, out_dir, escalation_file_path=escalation_input, log_path=run_log_path, cleaned_df=cleaned_df)
             output_path = pipeline_result["hx_csv"]
             processed_count = pipeline_result.get("processed_count", 0)
-            _log(f"Data processed successfully. {processed_count} records remaining.", log_path=run_log_path)
-            _log(f"HX output saved: {os.path.basename(output_path)}", log_path=run_log_path)
+            logger.info(f"Data processed successfully. {processed_count} records remaining.")
+            logger.info(f"HX output saved: {os.path.basename(output_path)}")
         except Exception as e:
             error_msg = f"Data processing failed: {str(e)}"
-            _log(f"ERROR: {error_msg}", log_path=run_log_path)
+            logger.error(f"ERROR: {error_msg}")
             messagebox.showerror("Processing Error", f"❌ {error_msg}\n\nCheck logs for details.")
             status_label.config(text="Processing failed. See logs.")
             return
@@ -131,7 +163,7 @@ def run_process_async(ecw_path: str, template_path: str, escalation_path: str, s
         try:
             success, upload_message = hx_upload(output_path, log_path=run_log_path)
             if success:
-                _log("Upload to HealthX successful.", log_path=run_log_path)
+                logger.info("Upload to HealthX successful.")
                 status_label.config(text="✅ Process Complete! Upload successful.")
                 messagebox.showinfo(
                     "Audentes Automation Tool",
@@ -142,7 +174,7 @@ def run_process_async(ecw_path: str, template_path: str, escalation_path: str, s
                     f"Check logs folder for details."
                 )
             else:
-                _log(f"Upload failed: {upload_message}", log_path=run_log_path)
+                logger.warning(f"Upload failed: {upload_message}")
                 status_label.config(text="⚠️ Processed successfully, but upload failed.")
                 messagebox.showwarning(
                     "Upload Warning",
@@ -151,7 +183,7 @@ def run_process_async(ecw_path: str, template_path: str, escalation_path: str, s
                 )
         except Exception as e:
             error_msg = f"Upload failed: {str(e)}"
-            _log(f"ERROR: {error_msg}", log_path=run_log_path)
+            logger.error(f"ERROR: {error_msg}")
             status_label.config(text="⚠️ Processed successfully, but upload failed.")
             messagebox.showwarning(
                 "Upload Error",
@@ -161,9 +193,13 @@ def run_process_async(ecw_path: str, template_path: str, escalation_path: str, s
 
     except Exception as exc:
         error_msg = f"Unexpected error: {str(exc)}"
-        _log(f"FATAL ERROR: {error_msg}", log_path=run_log_path if 'run_log_path' in locals() else None)
+        if not logger.handlers:
+            _setup_logging(_default_log_path())
+        logger.error(f"FATAL ERROR: {error_msg}")
         messagebox.showerror("Audentes Automation Tool", f"❌ {error_msg}\n\nSee logs folder for details.")
         status_label.config(text="Error occurred. See logs.")
+    finally:
+        _close_logging()
 
 
 def on_run_click(ecw_var: tk.StringVar, tpl_var: tk.StringVar, esc_var: tk.StringVar, status_label: tk.Label, root: tk.Tk) -> None:
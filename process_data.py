@@ -11,36 +11,247 @@ Pipeline:
 
 Compatible with macro-cleaned Excel file.
 """
-from typing import List, Optional
+from typing import Iterator, List, Optional
+import numpy as np
 import pandas as pd
 import re
 import os
+import codecs
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from macro import frame_from_json, frame_to_json, load_help_cache, save_help_cache
+
+
+# Prefer the Rust-backed calamine reader; openpyxl stays as the fallback engine
+try:
+    import python_calamine  # noqa: F401
+    _EXCEL_ENGINE = "calamine"
+except ImportError:
+    _EXCEL_ENGINE = "openpyxl"
+
+# Arrow-backed strings keep text in contiguous buffers and make the .str/.isin/.map passes cheaper;
+# pyarrow's CSV reader is also used for escalation input
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    _STRING_DTYPE = "string[pyarrow]"
+except ImportError:
+    pa = pc = pq = None
+    _STRING_DTYPE = None
+
+# Used to classify non-UTF-8 escalation CSVs from a small sample; latin-1 is assumed without it
+try:
+    from charset_normalizer import from_bytes as _detect_charset
+except ImportError:
+    _detect_charset = None
+
+# Bytes read from the head of a CSV to decide its encoding
+_ENCODING_SNIFF_BYTES = 64 * 1024
+
+# Rows per chunk when run_pipeline streams a CSV cleaned output
+_INPUT_CHUNK_ROWS = 100_000
+
+# Low-cardinality text columns run_pipeline stores as categoricals (values kept, rows hold codes)
+_CATEGORY_COLUMNS = ("Visit Type", "Visit Status", "Appointment Provider Name", "Primary Insurance Name")
+
 # ---------- Helper utilities ----------
 
+def _parquet_cache_path(path: str, sheet_name: Optional[str] = None) -> str:
+    """Parquet sidecar next to an Excel input (one per sheet when a sheet is named)."""
+    return f"{path}.parquet" if sheet_name is None else f"{path}.{sheet_name}.parquet"
+
+
+# Parquet schema metadata key holding the source workbook's "size:mtime_ns" stamp
+_SOURCE_STAMP_KEY = b"ev_automation_source_stat"
+
+
+def _source_stamp(path: str) -> bytes:
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}".encode()
+
+
 def _read_excel_auto(path: str, sheet_name: Optional[str] = None) -> pd.DataFrame:
-    """Read CSV or Excel."""
+    """Read CSV or Excel (as Arrow-backed strings when pyarrow is installed).
+
+    With pyarrow available, a parsed workbook is also written to a parquet sidecar
+    stamped with the workbook's size and mtime; later runs load the sidecar only
+    while that stamp still matches exactly (a replaced file re-parses, even if older).
+    """
     if path is None:
         raise ValueError("Path is None")
     if str(path).lower().endswith(".csv"):
-        return pd.read_csv(path, dtype=str, keep_default_na=False)
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+        return df.astype(_STRING_DTYPE) if _STRING_DTYPE else df
+
+    cache_path = _parquet_cache_path(path, sheet_name) if pq is not None else None
+    stamp = _source_stamp(path) if cache_path else None
+    if cache_path and os.path.isfile(cache_path):
+        try:
+            if (pq.read_schema(cache_path).metadata or {}).get(_SOURCE_STAMP_KEY) == stamp:
+                return pd.read_parquet(cache_path, engine="pyarrow").astype(_STRING_DTYPE)
+        except Exception as e:
+            print(f"Warning: Ignoring unreadable parquet cache {cache_path}: {e}")
+
+    sheet = 0 if sheet_name is None else sheet_name
+    df = pd.read_excel(path, sheet_name=sheet, dtype=str, keep_default_na=False, engine=_EXCEL_ENGINE)
+    df = df.astype(_STRING_DTYPE) if _STRING_DTYPE else df
+    if cache_path:
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            table = table.replace_schema_metadata({**(table.schema.metadata or {}), _SOURCE_STAMP_KEY: stamp})
+            pq.write_table(table, cache_path)
+        except Exception as e:
+            print(f"Warning: Could not write parquet cache {cache_path}: {e}")
+    return df
+
+
+def _iter_input(path: str, chunksize: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """Yield the cleaned output in chunks (CSV is streamed, Excel loads in one piece)."""
+    if str(path).lower().endswith(".csv"):
+        for chunk in pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunksize or _INPUT_CHUNK_ROWS):
+            yield chunk.astype(_STRING_DTYPE) if _STRING_DTYPE else chunk
     else:
-        sheet = 0 if sheet_name is None else sheet_name
-        return pd.read_excel(path, sheet_name=sheet, dtype=str, keep_default_na=False, engine="openpyxl")
+        yield _read_excel_auto(path)
+
+
+def _sniff_csv_encoding(path: str) -> str:
+    """Guess a CSV's encoding from a bounded sample (BOM, then strict UTF-8, then charset detection)."""
+    with open(path, "rb") as f:
+        sample = f.read(_ENCODING_SNIFF_BYTES)
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    try:
+        # Incremental decode so a multi-byte character cut off at the sample end is not an error
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    if _detect_charset is not None:
+        # Limit detection to the Western code pages these trackers are exported in
+        best = _detect_charset(sample, cp_isolation=["cp1252", "latin_1"]).best()
+        if best is not None:
+            return best.encoding
+    return "latin-1"
+
+
+def _read_csv_text(path: str, encoding: str, usecols: Optional[List[str]] = None) -> pd.DataFrame:
+    """Read a CSV (optionally only `usecols`) as all-text columns, using the multithreaded pyarrow parser when installed."""
+    if pa is not None:
+        try:
+            return pd.read_csv(path, dtype=str, keep_default_na=False, encoding=encoding, usecols=usecols, engine="pyarrow")
+        except UnicodeError:
+            raise
+        except Exception as e:
+            print(f"Warning: pyarrow CSV parser failed on {path} ({e}); retrying with the default parser")
+    return pd.read_csv(path, dtype=str, keep_default_na=False, encoding=encoding, usecols=usecols)
+
+
+_WS_RE = re.compile(r"\s+")
+
+
+def _col_index(df: pd.DataFrame) -> dict:
+    """Map stripped, lower-cased header -> original header (first occurrence wins), built once per frame."""
+    idx = {}
+    for c in df.columns:
+        idx.setdefault(str(c).strip().lower(), c)
+    return idx
+
+
+def _find_col(idx: dict, *needles: str) -> Optional[str]:
+    """Return the first column (in frame order) whose lower-cased name contains any of needles."""
+    for lower, col in idx.items():
+        if any(n in lower for n in needles):
+            return col
+    return None
+
+
+def _upper_categories(values: pd.Series, upper: bool = True) -> pd.Series:
+    """Strip + upper-case (just strip with upper=False) a repetitive text column as a categorical.
+
+    The string work runs once per distinct value; rows only carry integer codes,
+    so later ==/isin/map/.str calls also run on the categories.
+    Arrow-backed columns are dictionary-encoded and trimmed with Arrow compute
+    kernels, skipping the round-trip through Python str objects.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype) and not values.hasnans:
+        # Already encoded: only the categories need normalizing
+        codes = values.cat.codes.to_numpy()
+        normalized = values.cat.categories.astype(str).str.strip()
+        if upper:
+            normalized = normalized.str.upper()
+    elif pc is not None and values.dtype == _STRING_DTYPE:
+        arr = pa.array(values.array)
+        if isinstance(arr, pa.ChunkedArray):
+            # Multi-chunk columns (e.g. concatenated CSV chunks): one array gives one shared dictionary
+            arr = arr.combine_chunks()
+        # Nulls become "<NA>", as astype(str) renders them
+        encoded = pc.fill_null(arr, "<NA>").dictionary_encode()
+        codes = encoded.indices.to_numpy(zero_copy_only=False)
+        normalized = pc.utf8_trim_whitespace(encoded.dictionary)
+        if upper:
+            normalized = pc.utf8_upper(normalized)
+        normalized = normalized.to_numpy(zero_copy_only=False)
+    else:
+        cat = pd.Categorical(values.astype(str))
+        codes = cat.codes
+        normalized = cat.categories.str.strip()
+        if upper:
+            normalized = normalized.str.upper()
+    # Distinct raw values can collapse to the same normalized one (" pen" / "PEN")
+    remap, uniques = pd.factorize(normalized)
+    return pd.Series(pd.Categorical.from_codes(remap[codes], uniques), index=values.index)
+
+
+# Main-dataset account column candidates (substring match, first in column order wins)
+_MAIN_ACCOUNT_NAMES = ("patient account number", "patient account", "account number", "account", "patient acct no")
+
+
+def _normalized_sidecar(df: pd.DataFrame) -> dict:
+    """Precompute normalized forms of the columns several filters compare.
+
+    Keys are column names for the strip + upper forms (Visit Status / Visit Type /
+    Primary Insurance) and ("stripped", column) for the stripped account number.
+    """
+    idx = _col_index(df)
+    cols = {_find_col(idx, needle) for needle in ("visit status", "visit type", "primary insurance name", "primary insurance")}
+    norm = {col: _upper_categories(df[col]) for col in cols if col}
+    acc_col = _find_col(idx, *_MAIN_ACCOUNT_NAMES)
+    if acc_col:
+        norm[("stripped", acc_col)] = _upper_categories(df[acc_col], upper=False)
+    return norm
+
+
+def _sidecar_rows(cached: pd.Series, df: pd.DataFrame) -> pd.Series:
+    """Align a sidecar Series to the rows df still has."""
+    return cached if cached.index.equals(df.index) else cached.loc[df.index]
+
+
+def _upper_col(df: pd.DataFrame, col: str, norm: Optional[dict] = None) -> pd.Series:
+    """_upper_categories(df[col]), taken from the `norm` sidecar when it has the column."""
+    if norm is not None and col in norm:
+        return _sidecar_rows(norm[col], df)
+    return _upper_categories(df[col])
+
+
+def _norm_header(col) -> str:
+    """Collapse inner whitespace, strip and title-case a single header."""
+    if col is None:
+        return ""
+    return _WS_RE.sub(" ", str(col).strip()).title()
 
 
 def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
-    """Normalize headers (strip + title-case)."""
-    mapping = {}
-    for col in df.columns:
-        if col is None:
-            new = ""
-        else:
-            new = " ".join(str(col).strip().split())
-            new = new.title()
-        mapping[col] = new
-    return df.rename(columns=mapping)
+    """Normalize headers (strip + title-case).
+
+    Returns a new frame sharing the column data rather than renaming in place,
+    since callers may still hold the original (e.g. the in-memory macro output).
+    """
+    return df.rename(columns={c: _norm_header(c) for c in df.columns}, copy=False)
 
 
 def get_hx_field_mapping() -> dict:
@@ -71,17 +282,48 @@ def get_hx_field_mapping() -> dict:
 
 # ---------- Help sheet loading ----------
 
-def load_help_sheet(template_path: str):
+def load_help_sheet(template_path: str, cache_dir: Optional[str] = None):
     """
     Load Help sheet safely (even if Excel file is open or sheet name varies).
     Always returns: (help_df, provider_to_location, visit_type_to_workable, excluded_primary)
+
+    When cache_dir is given, the parsed result is kept in the Help cache shared with
+    macro.py (see macro.load_help_cache) and reused on later runs with the same
+    template content, skipping the Excel parse entirely.
     """
+    cached = load_help_cache(template_path, cache_dir, "lookups")
+    if cached is not None:
+        print("Loaded Help sheet mappings from cache")
+        return (
+            frame_from_json(cached["help_df"]),
+            cached["provider_to_location"],
+            cached["visit_type_to_workable"],
+            frozenset(cached["excluded_primary"]),
+        )
+
+    result = _parse_help_sheet(template_path)
+    help_df, provider_to_location, visit_type_to_workable, excluded_primary = result
+    if not help_df.empty:
+        save_help_cache(template_path, cache_dir, "lookups", {
+            "help_df": frame_to_json(help_df),
+            "provider_to_location": provider_to_location,
+            "visit_type_to_workable": visit_type_to_workable,
+            "excluded_primary": sorted(excluded_primary),
+        })
+    return result
+
+
+# Header substrings of the Help columns the mappings below use; other columns are never parsed
+_HELP_COL_NEEDLES = ("provider", "state", "location", "visit type", "workable", "primary insurance name")
+
+
+def _parse_help_sheet(template_path: str):
+    """Parse the Help sheet and build the lookup mappings (see load_help_sheet)."""
     help_df = None
 
     try:
-        # Load all sheet names first
-        xl = pd.ExcelFile(template_path, engine="openpyxl")
-        sheet_names = [s.strip().lower() for s in xl.sheet_names]
+        # Open the workbook once; sheet lookup and parse reuse the same handle
+        xl = pd.ExcelFile(template_path, engine=_EXCEL_ENGINE)
 
         # Find 'help' sheet by case-insensitive match
         help_sheet_name = next((s for s in xl.sheet_names if s.strip().lower() == "help"), None)
@@ -89,7 +331,11 @@ def load_help_sheet(template_path: str):
             # fallback: pick the first sheet if not found
             help_sheet_name = xl.sheet_names[0]
 
-        help_df = xl.parse(help_sheet_name, dtype=str)
+        help_df = xl.parse(
+            help_sheet_name,
+            dtype=str,
+            usecols=lambda c: any(n in _norm_header(c).lower() for n in _HELP_COL_NEEDLES),
+        )
         help_df = _normalize_columns(help_df)
         print(f"Loaded Help sheet: {help_sheet_name} ({len(help_df)} rows)")
 
@@ -98,39 +344,37 @@ def load_help_sheet(template_path: str):
         help_df = pd.DataFrame()
 
     # --- Extract mappings ---
-    provider_col = next((c for c in help_df.columns if "provider" in c.lower()), None)
-    loc_col = next((c for c in help_df.columns if "state" in c.lower() or "location" in c.lower()), None)
+    help_idx = _col_index(help_df)
+    provider_col = _find_col(help_idx, "provider")
+    loc_col = _find_col(help_idx, "state", "location")
 
     provider_to_location = {}
     if provider_col and loc_col:
-        for _, row in help_df[[provider_col, loc_col]].dropna().iterrows():
-            provider = str(row[provider_col]).strip()
-            location = str(row[loc_col]).strip()
-            if provider:
-                provider_to_location[provider.upper()] = location
+        sub = help_df[[provider_col, loc_col]].dropna()
+        providers = sub.iloc[:, 0].str.strip()
+        locations = sub.iloc[:, 1].str.strip()
+        has_provider = providers != ""
+        provider_to_location = dict(zip(providers[has_provider].str.upper(), locations[has_provider]))
 
     # Extract Visit Type -> Workable mapping from Help sheet
-    visit_type_col = next((c for c in help_df.columns if "visit type" in c.lower()), None)
-    workable_col = next((c for c in help_df.columns if "workable" in c.lower()), None)
+    visit_type_col = _find_col(help_idx, "visit type")
+    workable_col = _find_col(help_idx, "workable")
     visit_type_to_workable = {}
     if visit_type_col and workable_col:
-        for _, row in help_df[[visit_type_col, workable_col]].dropna().iterrows():
-            visit_type = str(row[visit_type_col]).strip().upper()
-            workable = str(row[workable_col]).strip().upper()
-            visit_type_to_workable[visit_type] = workable
+        sub = help_df[[visit_type_col, workable_col]].dropna()
+        visit_type_to_workable = dict(zip(
+            sub.iloc[:, 0].str.strip().str.upper(),
+            sub.iloc[:, 1].str.strip().str.upper(),
+        ))
         print(f"Found {len(visit_type_to_workable)} Visit Type -> Workable mappings in Help sheet")
     else:
         print("Warning: Visit Type or Workable column not found in Help sheet - workable filtering will be skipped")
 
     # Extract all Primary Insurance Name values from Help sheet for exclusion
-    prim_ins_col = next((c for c in help_df.columns if "primary insurance name" in c.lower()), None)
-    excluded_primary = set()
+    prim_ins_col = _find_col(help_idx, "primary insurance name")
+    excluded_primary = frozenset()
     if prim_ins_col:
-        excluded_primary = set(
-            str(x).strip().upper()
-            for x in help_df[prim_ins_col].dropna().tolist()
-            if str(x).strip()
-        )
+        excluded_primary = frozenset(help_df[prim_ins_col].dropna().str.strip().str.upper()) - {""}
         print(
             f"Found {len(excluded_primary)} Primary Insurance Name values in Help sheet to exclude"
         )
@@ -144,197 +388,282 @@ def load_help_sheet(template_path: str):
 #   ESCALATION FILTERING (BEFORE ALLOCATION PRIORITY)
 # ============================================================
 
-def apply_escalation_filter(df, escalation_path):
+def _load_escalation_accounts(escalation_path) -> Optional[frozenset]:
     """
-    Escalation filter:
-    - Load escalation file (CSV, XLSX, or XLSM)
-    - Find account column (tries: Acc#, Account Number, Account, Acc, Patient Account Number)
-    - Compare to Patient Account Number column in main dataset (tries multiple variations)
-    - Remove matching rows from main dataset
+    Load the escalation file (CSV, XLSX, or XLSM) and return its normalized account numbers.
+    Account column tries: Acc#, Account Number, Account, Acc, Patient Account Number.
+    Returns None when the filter should be skipped (no file, unreadable, no accounts).
     """
     if not escalation_path or not os.path.exists(escalation_path):
         print("No escalation file provided – skipping escalation filter")
-        return df
+        return None
     
+    # Priority order: Acc#, Account Number, Account, Acc, Patient Account Number
+    possible_names = ["acc#", "account number", "account", "acc", "patient account number"]
+
+    def is_account_col(col) -> bool:
+        # Same header normalization the frame gets below, so only the needed column is parsed
+        return _norm_header(col).lower() in possible_names
+
     try:
         # Load escalation file (CSV, XLSX, or XLSM)
         file_ext = os.path.splitext(escalation_path)[1].lower()
         if file_ext == ".csv":
-            # Try multiple encodings for CSV files
-            encodings = ["utf-8", "latin-1", "cp1252", "iso-8859-1"]
+            # Parse once with the sniffed encoding; the others are only retried if that fails further in
+            sniffed = _sniff_csv_encoding(escalation_path)
+            encodings = [sniffed] + [e for e in ("utf-8", "latin-1", "cp1252", "iso-8859-1") if e != sniffed]
             esc = None
             for enc in encodings:
                 try:
-                    esc = pd.read_csv(escalation_path, dtype=str, keep_default_na=False, encoding=enc)
+                    # Peek at the header, then parse only the account column
+                    header = pd.read_csv(escalation_path, nrows=0, encoding=enc).columns
+                    wanted = next((c for c in header if is_account_col(c)), None)
+                    esc = _read_csv_text(escalation_path, enc, usecols=[wanted]) if wanted is not None else pd.DataFrame(columns=header)
                     print(f"Successfully loaded escalation CSV with encoding: {enc}")
                     break
                 except (UnicodeDecodeError, UnicodeError):
                     continue
             if esc is None:
                 print(f"ERROR: Could not read CSV file with any encoding. Tried: {encodings}")
-                return df
+                return None
         elif file_ext in [".xlsx", ".xlsm"]:
-            # Excel file - load first sheet
-            esc = pd.read_excel(escalation_path, sheet_name=0, dtype=str, keep_default_na=False, engine="openpyxl")
+            # Excel file - load first sheet, keeping only the account column(s)
+            esc = pd.read_excel(escalation_path, sheet_name=0, dtype=str, keep_default_na=False, engine=_EXCEL_ENGINE, usecols=is_account_col)
+            if esc.columns.empty:
+                # No account column: reload just the header so the error below can list what is there
+                esc = pd.read_excel(escalation_path, sheet_name=0, dtype=str, nrows=0, engine=_EXCEL_ENGINE)
         else:
             print(f"ERROR: Unsupported file format: {file_ext}. Expected .csv, .xlsx, or .xlsm")
-            return df
+            return None
         
         esc = _normalize_columns(esc)
+        esc_idx = _col_index(esc)
         
         # Find account column - try multiple possible column names
-        acc_col = None
-        # Priority order: Acc#, Account Number, Account, Acc, Patient Account Number
-        possible_names = ["acc#", "account number", "account", "acc", "patient account number"]
-        for col in esc.columns:
-            col_lower = col.strip().lower()
-            if col_lower in possible_names:
-                acc_col = col
-                print(f"Found account column in escalation file: '{col}'")
-                break
+        acc_col = next((col for lower, col in esc_idx.items() if lower in possible_names), None)
+        if acc_col is not None:
+            print(f"Found account column in escalation file: '{acc_col}'")
         
         if acc_col is None:
             print(f"ERROR: Account column not found in escalation file. Available columns: {list(esc.columns)}")
             print(f"Looking for one of: {possible_names}")
-            return df
+            return None
         
         # Collect escalation account numbers - normalize to strings and strip whitespace
-        esc_accounts = esc[acc_col].astype(str).str.strip()
-        # Remove empty values and invalid entries
-        esc_accounts = set(a for a in esc_accounts if a and a.lower() not in ["", "nan", "none", "null"])
+        esc_acc = esc[acc_col].astype(str).str.strip()
+        # Remove empty values and invalid entries (vectorized; only the distinct survivors become the set)
+        valid = ~esc_acc.str.lower().isin(["", "nan", "none", "null"])
+        esc_accounts = frozenset(esc_acc.loc[valid].unique())
         
         if not esc_accounts:
             print("Escalation file has no valid account numbers – skipping")
-            return df
+            return None
         
         print(f"Loaded {len(esc_accounts)} account numbers from escalation file")
         # Debug: show first few account numbers
         sample_accounts = list(esc_accounts)[:5]
         print(f"Sample escalation account numbers: {sample_accounts}")
         
-        # Find main DF account column - try multiple possible names
-        main_acc_col = None
-        possible_main_names = ["patient account number", "patient account", "account number", "account", "patient acct no"]
-        for col in df.columns:
-            col_lower = col.strip().lower()
-            if any(name in col_lower for name in possible_main_names):
-                main_acc_col = col
-                print(f"Found account column in main dataset: '{col}'")
-                break
-        
-        if main_acc_col is None:
-            print(f"ERROR: Patient Account Number column not found in main dataset. Available columns: {list(df.columns)[:10]}...")
-            return df
-        
-        # Filter out matches - normalize both sides for comparison
-        before = len(df)
-        df["_acc_temp"] = df[main_acc_col].astype(str).str.strip()
-        # Count matches before filtering for debugging
-        matches = df["_acc_temp"].isin(esc_accounts)
-        match_count = matches.sum()
-        print(f"Found {match_count} matching account numbers to filter out")
-        
-        if match_count > 0:
-            # Show sample of accounts being filtered
-            sample_matches = df[matches]["_acc_temp"].head(5).tolist()
-            print(f"Sample accounts being filtered: {sample_matches}")
-        
-        df = df[~matches]
-        df = df.drop(columns=["_acc_temp"])
-        removed = before - len(df)
-        print(f"Escalation filter removed {removed} rows (from {before} to {len(df)})")
-        return df
+        return esc_accounts
         
     except Exception as e:
-        print(f"Error applying escalation filter: {e} – skipping escalation filter.")
+        print(f"Error loading escalation file: {e} – skipping escalation filter.")
         import traceback
         print(traceback.format_exc())
+        return None
+
+
+def _escalation_mask(df: pd.DataFrame, esc_accounts: frozenset, keep: Optional[pd.Series] = None, norm: Optional[dict] = None) -> Optional[pd.Series]:
+    """
+    Rows of df whose Patient Account Number (tries multiple variations) is in esc_accounts.
+    Returns None if df has no account column. `keep` limits the printed match count/samples
+    to the rows earlier filters are keeping; `norm` may carry the pre-stripped account column.
+    """
+    main_acc_col = _find_col(_col_index(df), *_MAIN_ACCOUNT_NAMES)
+    if main_acc_col is None:
+        print(f"ERROR: Patient Account Number column not found in main dataset. Available columns: {list(df.columns)[:10]}...")
+        return None
+    print(f"Found account column in main dataset: '{main_acc_col}'")
+
+    # Normalize the main side the same way as the escalation accounts
+    cached = norm.get(("stripped", main_acc_col)) if norm else None
+    acc_norm = _sidecar_rows(cached, df) if cached is not None else _upper_categories(df[main_acc_col], upper=False)
+    matches = acc_norm.isin(esc_accounts)
+    counted = matches if keep is None else matches & keep
+    match_count = int(counted.sum())
+    print(f"Found {match_count} matching account numbers to filter out")
+    if match_count > 0:
+        # Show sample of accounts being filtered
+        sample_matches = acc_norm[counted].head(5).tolist()
+        print(f"Sample accounts being filtered: {sample_matches}")
+    return matches
+
+
+def apply_escalation_filter(df, escalation_path):
+    """
+    Escalation filter:
+    - Load escalation file (CSV, XLSX, or XLSM)
+    - Find account column (tries: Acc#, Account Number, Account, Acc, Patient Account Number)
+    - Compare to Patient Account Number column in main dataset (tries multiple variations)
+    - Remove matching rows from main dataset
+
+    run_pipeline folds the same mask into check_workable_and_exclusions instead.
+    """
+    esc_accounts = _load_escalation_accounts(escalation_path)
+    if not esc_accounts:
         return df
+    matches = _escalation_mask(df, esc_accounts)
+    if matches is None:
+        return df
+    before = len(df)
+    df = df.loc[~matches]
+    print(f"Escalation filter removed {before - len(df)} rows (from {before} to {len(df)})")
+    return df
 
 
 
 # ---------- Workable + exclusion filters ----------
 
-def check_workable_and_exclusions(df: pd.DataFrame, visit_type_to_workable: dict, excluded_primary_ins: set):
+def check_workable_and_exclusions(df: pd.DataFrame, visit_type_to_workable: dict, excluded_primary_ins: frozenset, esc_accounts: Optional[frozenset] = None, norm: Optional[dict] = None):
+    """Drop Workable = N visit types, excluded primary insurances and (optionally) escalated accounts.
+
+    Returns (kept, warnings); escalated rows are dropped without a warning row.
+    Both lookups must already be in load_help_sheet's normalized form (mapping
+    keys/values and exclusions stripped + upper-cased); run_pipeline enforces
+    this at the call site so rows here are matched by plain hash lookups.
+
+    All masks are built on the input frame and applied in one slice; warnings
+    and printed counts keep the step order (each step only counts rows the
+    earlier ones kept).
+    """
     df = df.copy()
     warnings = []
+    idx = _col_index(df)
+    drop = pd.Series(False, index=df.index)
 
     # Workable - Look up Visit Type in Help sheet mapping
-    visit_type_col = next((c for c in df.columns if "visit type" in c.lower()), None)
+    visit_type_col = _find_col(idx, "visit type")
     if visit_type_col and visit_type_to_workable:
         # Map each row's Visit Type to its Workable status from Help sheet
-        df_visit_normalized = df[visit_type_col].astype(str).str.strip().str.upper()
+        df_visit_normalized = _upper_col(df, visit_type_col, norm)
         df_workable_status = df_visit_normalized.map(visit_type_to_workable)
-        
+
         # Exclude rows where Workable = "N" (only exclude if explicitly "N", keep if missing from mapping)
-        mask_n = df_workable_status.str.upper() == "N"
+        mask_n = df_workable_status == "N"
         if mask_n.any():
             excluded_count = mask_n.sum()
             w = df[mask_n].copy()
             w["_warning_reason"] = "Workable = N (from Help sheet)"
             warnings.append(w)
             print(f"Excluding {excluded_count} rows with Visit Type having Workable = N in Help sheet")
-        df = df[~mask_n].reset_index(drop=True)
+        drop |= mask_n
     elif visit_type_col:
         print("Warning: Visit Type -> Workable mapping not available - skipping workable filter")
 
     # Excluded insurances - match against Primary Insurance Name values from Help sheet
-    prim_col = next((c for c in df.columns if "primary insurance" in c.lower()), None)
+    prim_col = _find_col(idx, "primary insurance")
     if prim_col and excluded_primary_ins:
         # Normalize values for comparison (strip whitespace, case-insensitive)
-        df_prim_normalized = df[prim_col].astype(str).str.strip().str.upper()
-        mask_excl = df_prim_normalized.isin(excluded_primary_ins)
+        df_prim_normalized = _upper_col(df, prim_col, norm)
+        mask_excl = df_prim_normalized.isin(excluded_primary_ins) & ~drop
         if mask_excl.any():
             excluded_count = mask_excl.sum()
             w2 = df[mask_excl].copy()
             w2["_warning_reason"] = "Excluded Primary Insurance"
             warnings.append(w2)
             print(f"Excluding {excluded_count} rows with Primary Insurance Name matching Help sheet values")
-        df = df[~mask_excl].reset_index(drop=True)
+        drop |= mask_excl
 
-    if warnings:
-        warn_df = pd.concat(warnings, axis=0, ignore_index=True)
-    else:
-        warn_df = pd.DataFrame(columns=list(df.columns) + ["_warning_reason"])
+    # Escalated accounts (Acc# comparison) - BEFORE allocation priority
+    if esc_accounts:
+        matches = _escalation_mask(df, esc_accounts, keep=~drop, norm=norm)
+        if matches is not None:
+            before = len(df) - int(drop.sum())
+            drop |= matches
+            after = len(df) - int(drop.sum())
+            print(f"Escalation filter removed {before - after} rows (from {before} to {after})")
+
+    df = df.loc[~drop].reset_index(drop=True)
+    warn_df = pd.concat(warnings, axis=0, ignore_index=True, copy=False) if warnings else pd.DataFrame(columns=["_warning_reason"])
 
     return df, warn_df
 
 
 # ---------- Visit Status Filter (PEN/PR only) ----------
 
+def _ins_ver_mask(df: pd.DataFrame, idx: dict, norm: Optional[dict] = None) -> Optional[pd.Series]:
+    """Rows whose Visit Status is INS VER : Insurance Verified (None if there is no Visit Status column)."""
+    visit_col = _find_col(idx, "visit status")
+    if not visit_col:
+        print("WARNING: Visit Status column not found – skipping INS VER exclusion")
+        return None
+    return _upper_col(df, visit_col, norm) == "INS VER : INSURANCE VERIFIED"
+
+
 def apply_visit_status_filter(df: pd.DataFrame) -> pd.DataFrame:
     """Exclude rows where Visit Status is INS VER : Insurance Verified."""
-    df = df.copy()
-    visit_col = next((c for c in df.columns if "visit status" in c.lower()), None)
-    
-    if visit_col:
-        df["_visit_status_u"] = df[visit_col].astype(str).str.strip().str.upper()
+    mask = _ins_ver_mask(df, _col_index(df))
+    if mask is not None:
         before = len(df)
-        df = df[df["_visit_status_u"] != "INS VER : INSURANCE VERIFIED"]
-        df = df.drop(columns=["_visit_status_u"])
+        df = df.loc[~mask]
         print(f"Visit Status filter (exclude INS VER): {before} -> {len(df)} rows")
-    else:
-        print("WARNING: Visit Status column not found – skipping INS VER exclusion")
-    
     return df
 
 
 # ---------- Remove WC from Primary Insurance Name ----------
 
+def _wc_mask(df: pd.DataFrame, idx: dict, norm: Optional[dict] = None) -> Optional[pd.Series]:
+    """Rows whose Primary Insurance Name contains 'WC' (None if there is no such column)."""
+    ins_col = _find_col(idx, "primary insurance name")
+    if not ins_col:
+        print("WARNING: Primary Insurance Name column not found – cannot remove WC")
+        return None
+    return _upper_col(df, ins_col, norm).str.contains("WC", na=False)
+
+
 def remove_wc_visit_type(df: pd.DataFrame) -> pd.DataFrame:
     """Remove rows where Primary Insurance Name contains 'WC'."""
-    df = df.copy()
-    ins_col = next((c for c in df.columns if "primary insurance name" in c.lower()), None)
-    
-    if ins_col:
-        df["_ins_u"] = df[ins_col].astype(str).str.upper()
+    mask = _wc_mask(df, _col_index(df))
+    if mask is not None:
         before = len(df)
-        df = df[~df["_ins_u"].str.contains("WC", na=False)]
-        df = df.drop(columns=["_ins_u"])
+        df = df.loc[~mask]
         print(f"WC Primary Insurance removal: {before} -> {len(df)} rows")
+    return df
+
+
+def apply_visit_status_and_wc_filters(df: pd.DataFrame, norm: Optional[dict] = None) -> pd.DataFrame:
+    """apply_visit_status_filter + remove_wc_visit_type with both masks built first and a single slice."""
+    idx = _col_index(df)
+    ins_ver = _ins_ver_mask(df, idx, norm)
+    wc = _wc_mask(df, idx, norm)
+
+    # Report the same per-step counts as running the two filters one after the other
+    before = len(df)
+    drop = pd.Series(False, index=df.index)
+    if ins_ver is not None:
+        drop |= ins_ver
+        print(f"Visit Status filter (exclude INS VER): {before} -> {before - int(drop.sum())} rows")
+    if wc is not None:
+        after_visit = before - int(drop.sum())
+        drop |= wc
+        print(f"WC Primary Insurance removal: {after_visit} -> {before - int(drop.sum())} rows")
+    return df.loc[~drop]
+
+
+# ---------- Appointment Location ----------
+
+def _map_appointment_location(df: pd.DataFrame, provider_to_location: dict) -> pd.DataFrame:
+    """Set Appointment Location from the Help sheet provider -> state lookup.
+
+    A new column goes last, or just before a trailing _warning_reason on warning rows.
+    """
+    # Look up each distinct provider once, then broadcast through the category codes
+    providers = _upper_categories(df["Appointment Provider Name"]).cat
+    locations = np.array([provider_to_location.get(c) for c in providers.categories], dtype=object)[providers.codes]
+    if "Appointment Location" in df.columns or "_warning_reason" not in df.columns:
+        df["Appointment Location"] = locations
     else:
-        print("WARNING: Primary Insurance Name column not found – cannot remove WC")
-    
+        df.insert(df.columns.get_loc("_warning_reason"), "Appointment Location", locations)
     return df
 
 
@@ -342,12 +671,19 @@ def remove_wc_visit_type(df: pd.DataFrame) -> pd.DataFrame:
 
 def _get_visit_type_series(df: pd.DataFrame) -> pd.Series:
     """Extract visit type column as a series for robust matching."""
-    vt_col = next((c for c in df.columns if "visit type" in c.lower()), None)
+    vt_col = _find_col(_col_index(df), "visit type")
     if vt_col:
         return df[vt_col].astype(str).fillna("")
     return pd.Series([""] * len(df))
 
 
+def _alloc_seq(total: int, cycle: int) -> np.ndarray:
+    """Bucket numbers 1..cycle for `total` sorted rows: base+1 rows in the first total % cycle buckets, base in the rest."""
+    base, extra = divmod(total, cycle)
+    counts = base + (np.arange(cycle) < extra)
+    return np.repeat(np.arange(1, cycle + 1), counts)
+
+
 def _assign_allocation_priority(df: pd.DataFrame, np_cycle: int = 8, fu_cycle: int = 8) -> pd.DataFrame:
     """
     Assign allocation priorities with corrected sorting:
@@ -373,18 +709,23 @@ def _assign_allocation_priority(df: pd.DataFrame, np_cycle: int = 8, fu_cycle: i
 
     # Identify Visit Type (determine NP/FU)
     visit_type_series = _get_visit_type_series(df)
-    df["Allocation Group"] = visit_type_series.apply(lambda x: "NP" if "new" in str(x).lower() else "FU")
+    # "new" is looked for once per distinct Visit Type, then broadcast through the category codes
+    visit_types = pd.Categorical(visit_type_series)
+    is_new = np.asarray(visit_types.categories.str.lower().str.contains("new", regex=False), dtype=bool)
+    df["Allocation Group"] = np.where(is_new[visit_types.codes], "NP", "FU").astype(object)
+
+    idx = _col_index(df)
 
     # Parse DOS safely
-    dos_col = next((c for c in df.columns if "date of service" in c.lower() or "appointment date" in c.lower()), None)
+    dos_col = _find_col(idx, "date of service", "appointment date")
     if dos_col:
         df["_dos_parsed"] = pd.to_datetime(df[dos_col], errors="coerce")
     else:
         df["_dos_parsed"] = pd.NaT
 
     # Identify Provider and Location columns
-    provider_col = next((c for c in df.columns if "provider" in c.lower()), None)
-    location_col = next((c for c in df.columns if "appointment location" in c.lower() or "appointment state" in c.lower()), None)
+    provider_col = _find_col(idx, "provider")
+    location_col = _find_col(idx, "appointment location", "appointment state")
 
     if not provider_col:
         df["Provider Name"] = ""
@@ -428,22 +769,8 @@ def _assign_allocation_priority(df: pd.DataFrame, np_cycle: int = 8, fu_cycle: i
         ).reset_index(drop=True)
 
         # Apply math logic safely
-        total = len(df_np)
-        base = total // np_cycle
-        extra = total % np_cycle
-
-        counts = [base + (1 if i < extra else 0) for i in range(np_cycle)]
-
-        alloc_seq_list = []
-        for seq, count in enumerate(counts, start=1):
-            alloc_seq_list.extend([seq] * count)
-
-        alloc_seq_list = alloc_seq_list[:total]
-
-        df_np["_alloc_seq"] = alloc_seq_list
+        df_np["_alloc_seq"] = _alloc_seq(len(df_np), np_cycle)
         df_np["_alloc_group"] = "NP"
-    else:
-        df_np = df_np.copy()
 
 
     # ---------- FU Logic ----------
@@ -459,59 +786,39 @@ def _assign_allocation_priority(df: pd.DataFrame, np_cycle: int = 8, fu_cycle: i
 
         fu_cycle = 8
 
-        fu_final = []
-
         # Determine provider and location columns within FU subset
         fu_provider_col = provider_col if provider_col in df_fu.columns else "Provider Name"
         fu_location_col = location_col if location_col in df_fu.columns else "Appointment Location"
 
-        # Process state-wise
-        for state in sorted(df_fu[fu_location_col].fillna("").unique()):
-
-            state_df = df_fu[df_fu[fu_location_col] == state].copy()
-
-            # FU: Sort by Provider -> Location (A->Z for both) within each state
-            state_df = state_df.sort_values(by=[fu_provider_col, fu_location_col], ascending=[True, True], kind="stable").reset_index(drop=True)
-
-            # ----- ALLOCATION MATH -----
-
-            total = len(state_df)
-
-            # counts per bucket (1..8)
-            base = total // fu_cycle
-            extra = total % fu_cycle
-
-            # e.g. total=101 → [13,13,13,13,13,13,12,12]
-            counts = [base + (1 if i < extra else 0) for i in range(fu_cycle)]
-
-            # Build the allocation sequence
-            seq = []
-            for alloc_num, count in enumerate(counts, start=1):
-                seq.extend([alloc_num] * count)
-
-            # Assign final sequence
-            state_df["_alloc_seq"] = seq
-            state_df["_alloc_group"] = "FU"
-
-            fu_final.append(state_df)
-
-        df_fu = pd.concat(fu_final, ignore_index=True)
-    else:
-        df_fu = df_fu.copy()
+        # Rows without a location never matched a state in the per-state split, so they stay out
+        df_fu = df_fu[df_fu[fu_location_col].notna()]
+
+        # FU: one stable sort by state, then Provider (A->Z) within each state, which gives the
+        # same order as sorting each state separately and concatenating the states A->Z
+        df_fu = df_fu.sort_values(by=[fu_location_col, fu_provider_col], ascending=[True, True], kind="stable").reset_index(drop=True)
+
+        # ----- ALLOCATION MATH -----
+        # Per state: bucket sizes base+1 for the first `extra` buckets, then base,
+        # e.g. total=101 -> [13,13,13,13,13,12,12,12]; position -> bucket in closed form
+        grp = df_fu.groupby(fu_location_col, sort=False)
+        pos = grp.cumcount().to_numpy()
+        total = grp[fu_location_col].transform("size").to_numpy()
+        base = total // fu_cycle
+        extra = total % fu_cycle
+        big = extra * (base + 1)
+        df_fu["_alloc_seq"] = np.where(pos < big, pos // (base + 1), extra + (pos - big) // np.maximum(base, 1)) + 1
+        df_fu["_alloc_group"] = "FU"
 
     # ---------- Combine NP + FU ----------
-    combined = pd.concat([df_np, df_fu], ignore_index=True, sort=False)
+    combined = pd.concat([df_np, df_fu], ignore_index=True, sort=False, copy=False)
 
     # ---- BUILD ALLOCATION PRIORITY CODE ----
-    def make_code(prefix, seq):
-        if pd.isna(seq) or prefix not in ["NP", "FU"]:
-            return ""
-        return f"{prefix}{int(seq):03d}"
-
-    combined["Allocation Priority"] = combined.apply(
-        lambda r: make_code(r.get("_alloc_group"), r.get("_alloc_seq")),
-        axis=1
-    )
+    # Vectorized "NP001"/"FU001"; rows without a valid group or sequence get ""
+    blank = pd.Series("", index=combined.index, dtype=object)
+    prefix = combined.get("_alloc_group", blank).astype(str)
+    seq = pd.to_numeric(combined.get("_alloc_seq", blank), errors="coerce").astype("Int64")
+    valid = prefix.isin(["NP", "FU"]) & seq.notna()
+    combined["Allocation Priority"] = (prefix + seq.astype(str).str.zfill(3)).where(valid, "")
 
     return combined
 
@@ -521,23 +828,82 @@ def _assign_allocation_priority(df: pd.DataFrame, np_cycle: int = 8, fu_cycle: i
 
 def assign_agents(df: pd.DataFrame):
     agents = ["Agent-1","Agent-2","Agent-3","Agent-4","Agent-5","Agent-6","Agent-7","Agent-8"]
-    prov_col = next((c for c in df.columns if "provider" in c.lower()), None)
-    mapping = {}
-    assigned = []
-    rr = 0
-    for prov in df[prov_col].fillna("").tolist():
-        if prov in mapping:
-            assigned.append(mapping[prov])
-        else:
-            mapping[prov] = agents[rr % len(agents)]
-            assigned.append(mapping[prov])
-            rr += 1
-    df["Assigned Agent"] = assigned
+    prov_col = _find_col(_col_index(df), "provider")
+    if prov_col is None:
+        # No provider column: every row counts as the same (blank) provider
+        df["Assigned Agent"] = agents[0]
+        return df
+    # factorize numbers providers in first-appearance order, so codes mod 8 is the round-robin
+    providers = df[prov_col]
+    if isinstance(providers.dtype, pd.CategoricalDtype) and providers.hasnans:
+        # fillna("") would need "" as a category
+        providers = providers.astype(object)
+    codes, _ = pd.factorize(providers.fillna("") if providers.hasnans else providers)
+    df["Assigned Agent"] = np.take(agents, codes % len(agents))
     return df
 
 
 # ---------- Build HX output ----------
 
+# Dates already in m/d/yyyy form, captured as (month, day, year) so they can be zero-padded
+_MMDDYYYY = re.compile(r'^(\d{1,2})/(\d{1,2})/(\d{4})$')
+
+# Explicit formats tried for date values the general parser rejects
+_DATE_FALLBACK_FORMATS = ['%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y', '%Y/%m/%d', '%m-%d-%Y', '%d-%m-%Y']
+
+
+def _format_date_fallback(value: str) -> str:
+    """Try the explicit formats on one value the general parser rejected; return it stripped if none match."""
+    for fmt in _DATE_FALLBACK_FORMATS:
+        dt = pd.to_datetime(value, format=fmt, errors='coerce')
+        if not pd.isna(dt):
+            return dt.strftime("%m/%d/%Y")
+    return value.strip()
+
+
+def _format_dates(values: pd.Series) -> pd.Series:
+    """Convert a date column to mm/dd/yyyy text.
+
+    Blank/nan/none/nat become "", m/d/yyyy values are zero-padded as-is, anything
+    else is parsed (per-format fallback for the rejects) and unparseable values
+    are kept stripped. Each distinct value is handled once and broadcast back.
+    """
+    raw = values.astype(object)
+    codes, uniques = pd.factorize(raw.where(raw.notna(), "").astype(str))
+    u = pd.Series(uniques, dtype=object)
+    stripped = u.str.strip()
+    out = stripped.copy()
+
+    blank = stripped.eq("") | stripped.str.lower().isin(["nan", "none", "nat"])
+    # If already in mm/dd/yyyy format, only normalize to 2-digit month/day
+    parts = stripped.str.extract(_MMDDYYYY)
+    mdy = parts[0].notna()
+    out[mdy] = parts[0][mdy].str.zfill(2) + "/" + parts[1][mdy].str.zfill(2) + "/" + parts[2][mdy]
+
+    rest = ~(blank | mdy)
+    if rest.any():
+        try:
+            parsed = pd.to_datetime(u[rest], errors='coerce', format="mixed")
+            formatted = parsed.dt.strftime("%m/%d/%Y")
+        except (ValueError, TypeError, AttributeError):
+            # e.g. mixed time zones: fall back to parsing the values one at a time
+            parsed = u[rest].map(lambda v: pd.to_datetime(v, errors='coerce'))
+            formatted = parsed.map(lambda dt: "" if pd.isna(dt) else dt.strftime("%m/%d/%Y"))
+        ok = parsed.notna()
+        out[ok[ok].index] = formatted[ok]
+        bad = ok[~ok].index
+        out[bad] = [_format_date_fallback(v) for v in u[bad]]
+    out[blank] = ""
+
+    return pd.Series(out.to_numpy()[codes], index=values.index)
+
+def _hx_source_columns(df: pd.DataFrame, mapping: dict) -> List[str]:
+    """Columns of df (in frame order) that build_hx_csv can read for `mapping`."""
+    wanted = {"allocation priority"}
+    wanted.update(str(src).strip().lower() for src in mapping.values() if src)
+    return [c for c in df.columns if str(c).strip().lower() in wanted]
+
+
 def build_hx_csv(df: pd.DataFrame, out_dir: str, mapping: dict) -> str:
     """
     Build final HX CSV based on provided mapping.
@@ -554,71 +920,36 @@ def build_hx_csv(df: pd.DataFrame, out_dir: str, mapping: dict) -> str:
     
     # Date fields that need mm/dd/yyyy formatting
     date_fields = {"DOB", "Date of Service"}
-    
-    def format_date(value, field_name):
-        """Convert date to mm/dd/yyyy format."""
-        if pd.isna(value) or str(value).strip() == "" or str(value).strip().lower() in ["nan", "none", "nat"]:
-            return ""
-        val_str = str(value).strip()
-        # If already in mm/dd/yyyy format, return as-is
-        if re.match(r'^\d{1,2}/\d{1,2}/\d{4}$', val_str):
-            # Normalize to ensure 2-digit month/day
-            parts = val_str.split('/')
-            if len(parts) == 3:
-                month, day, year = parts
-                return f"{int(month):02d}/{int(day):02d}/{year}"
-            return val_str
-        try:
-            # Try parsing as datetime with multiple formats
-            dt = pd.to_datetime(value, errors='coerce', infer_datetime_format=True)
-            if pd.isna(dt):
-                # Try parsing common date string formats
-                for fmt in ['%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y', '%Y/%m/%d', '%m-%d-%Y', '%d-%m-%Y']:
-                    try:
-                        dt = pd.to_datetime(value, format=fmt, errors='coerce')
-                        if not pd.isna(dt):
-                            break
-                    except:
-                        continue
-            if pd.isna(dt):
-                return val_str
-            return dt.strftime("%m/%d/%Y")
-        except Exception as e:
-            return val_str
-    
-    output = {}
+
+    # One object array per HX column, filled in place and wrapped into a frame once
+    n_rows = len(df)
+    output = {hx_field: np.empty(n_rows, dtype=object) for hx_field in out_cols}
+    idx = _col_index(df)
     for hx_field in out_cols:
         src_field = mapping_clean[hx_field]
         if src_field is None:
-            output[hx_field] = df.get("Allocation Priority", "")
+            src = df.get("Allocation Priority")
+            output[hx_field][:] = "" if src is None else src.to_numpy(dtype=object)
         elif src_field == "Audentes_Verification":
-            output[hx_field] = ["Audentes_Verification"] * len(df)
-        elif src_field in df.columns:
-            if hx_field in date_fields:
-                # Format dates to mm/dd/yyyy
-                output[hx_field] = df[src_field].apply(lambda x: format_date(x, hx_field))
-            else:
-                output[hx_field] = df[src_field].fillna("").astype(str)
+            output[hx_field][:] = "Audentes_Verification"
         else:
-            alt = next((c for c in df.columns if c.strip().lower() == src_field.strip().lower()), None)
-            if alt:
-                if hx_field in date_fields:
-                    # Format dates to mm/dd/yyyy
-                    output[hx_field] = df[alt].apply(lambda x: format_date(x, hx_field))
-                else:
-                    output[hx_field] = df[alt].fillna("").astype(str)
+            col = src_field if src_field in df.columns else idx.get(src_field.strip().lower())
+            if col is None:
+                output[hx_field][:] = ""
+            elif hx_field in date_fields:
+                # Format dates to mm/dd/yyyy
+                output[hx_field][:] = _format_dates(df[col]).to_numpy(dtype=object)
+            elif isinstance(df[col].dtype, pd.CategoricalDtype):
+                # Text-convert the categories once and gather; missing values (code -1) take the trailing ""
+                labels = np.append(df[col].cat.categories.astype(str).to_numpy(dtype=object), "")
+                output[hx_field][:] = labels[df[col].cat.codes.to_numpy()]
             else:
-                output[hx_field] = [""] * len(df)
+                output[hx_field][:] = df[col].fillna("").astype(str).to_numpy(dtype=object)
 
-    hx_df = pd.DataFrame(output)[out_cols]
+    hx_df = pd.DataFrame(output, columns=out_cols, copy=False)
     # Ensure all column headers are clean (no BOM, no leading/trailing spaces, no zero-width chars)
     hx_df.columns = [str(c).strip().replace('\ufeff', '').replace('\u200b', '').replace('\u200c', '').replace('\u200d', '').strip() for c in hx_df.columns]
     
-    # Post-process date columns to ensure mm/dd/yyyy format
-    for date_col in date_fields:
-        if date_col in hx_df.columns:
-            hx_df[date_col] = hx_df[date_col].apply(lambda x: format_date(x, date_col))
-    
     # Verify Organization column exists and is first
     if 'Organization' not in hx_df.columns:
         # Try to find it with case-insensitive or spacing variations
@@ -636,7 +967,8 @@ def build_hx_csv(df: pd.DataFrame, out_dir: str, mapping: dict) -> str:
         print(f"WARNING: 'Organization' column not found! Available columns: {list(hx_df.columns)}")
 
     out_path = os.path.join(out_dir, f"HX_Final_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
-    # Use utf-8 instead of utf-8-sig to avoid BOM issues that HealthX might not handle
+    # Use utf-8 instead of utf-8-sig to avoid BOM issues that HealthX might not handle.
+    # HealthX takes pandas' quoting as-is (only fields containing commas/quotes are quoted)
     hx_df.to_csv(out_path, index=False, encoding="utf-8")
 
     print(f"Final HX CSV created with {len(hx_df)} rows -> {out_path}")
@@ -645,6 +977,10 @@ def build_hx_csv(df: pd.DataFrame, out_dir: str, mapping: dict) -> str:
 
 # ---------- Post-Macro Filters ----------
 
+# Single-pass patterns for the status filters below
+_PEN_PR_RE = re.compile(r"PEN|PR")
+_ESCALATED_RE = re.compile(r"Escalated on (?:Smartsheet|Teams)", re.IGNORECASE)
+
 def post_macro_filters(df: pd.DataFrame, escalation_path: Optional[str] = None) -> pd.DataFrame:
     """
     Apply post-macro business rules based on BRD:
@@ -657,33 +993,43 @@ def post_macro_filters(df: pd.DataFrame, escalation_path: Optional[str] = None)
     initial_rows = len(df)
     print(f"Applying post-macro filters... (initial rows = {initial_rows})")
 
+    idx = _col_index(df)
+
+    # Steps 1 and 2 build their masks first and slice the frame once;
+    # the printed counts still follow the step order.
+    drop = pd.Series(False, index=df.index)
+
     # --- 1. Visit Status filter ---
     # Look for Visit Status column specifically (not just any "status" column)
-    visit_col = next((c for c in df.columns if "visit status" in c.lower()), None)
+    visit_col = _find_col(idx, "visit status")
     if visit_col:
         before = len(df)
+        visit_status_upper = _upper_categories(df[visit_col])
         # Get unique values for debugging
-        unique_vals = df[visit_col].astype(str).str.strip().str.upper().unique()
+        unique_vals = visit_status_upper.unique()
         print(f"Found Visit Status column: '{visit_col}' with values: {sorted(unique_vals[:10])}")
         # Filter for values that start with PEN or PR (handles "PEN : PENDING", "PR : PENDING REFERRAL", etc.)
-        visit_status_upper = df[visit_col].astype(str).str.strip().str.upper()
-        mask = visit_status_upper.str.startswith("PEN") | visit_status_upper.str.startswith("PR")
-        df = df[mask]
-        print(f"After Visit Status filter (PEN/PR only): {len(df)} rows (removed {before - len(df)})")
-        if len(df) == 0:
+        drop |= ~visit_status_upper.str.match(_PEN_PR_RE)
+        remaining = before - int(drop.sum())
+        print(f"After Visit Status filter (PEN/PR only): {remaining} rows (removed {before - remaining})")
+        if remaining == 0:
             print(f"WARNING: All rows filtered out! Original values were: {sorted(unique_vals)}")
     else:
         print("Warning: Visit Status column not found, skipping filter")
 
     # --- 2. Exclude Primary Insurance containing 'WC' ---
-    ins_col = next((c for c in df.columns if "primary insurance name" in c.lower()), None)
+    ins_col = _find_col(idx, "primary insurance name")
     if ins_col:
-        before = len(df)
-        df = df[~df[ins_col].astype(str).str.upper().str.contains("WC", na=False)]
-        print(f"After excluding WC payors: {len(df)} rows (removed {before - len(df)})")
+        before = len(df) - int(drop.sum())
+        drop |= _upper_categories(df[ins_col]).str.contains("WC", na=False)
+        remaining = len(df) - int(drop.sum())
+        print(f"After excluding WC payors: {remaining} rows (removed {before - remaining})")
     else:
         print("Warning: Primary Insurance Name column not found, skipping WC filter")
 
+    if drop.any():
+        df = df.loc[~drop]
+
     # --- 3. Escalation filtering is now handled by apply_escalation_filter() in run_pipeline() ---
     # (Removed old escalation lookup - now using proper status/DOS filtering in apply_escalation_filter)
     print("Escalation filtering will be applied later in the pipeline with proper status/DOS filtering")
@@ -691,11 +1037,9 @@ def post_macro_filters(df: pd.DataFrame, escalation_path: Optional[str] = None)
     # --- 4. Remove certain 'Status' and 'Categorization' entries ---
     before = len(df)
     if before > 0:  # Only apply if we still have rows
-        for c in df.columns:
-            cl = c.lower()
+        for cl, c in idx.items():
             if "status" in cl and c != visit_col:  # Don't filter the Visit Status column we already filtered
-                mask = df[c].astype(str).str.contains("Escalated on Smartsheet", case=False, na=False) | \
-                       df[c].astype(str).str.contains("Escalated on Teams", case=False, na=False)
+                mask = df[c].astype(str).str.contains(_ESCALATED_RE, na=False)
                 df = df[~mask]
             if "categorization" in cl:
                 df = df[~df[c].astype(str).str.contains("Phreesia", case=False, na=False)]
@@ -761,77 +1105,127 @@ def post_macro_filters(df: pd.DataFrame, escalation_path: Optional[str] = None)
 #         return df
 
 
-# ---------- Main Pipeline ----------
-from macro import audentes_verification_cleaned
+def _filter_input(cleaned_file: Optional[str], cleaned_df: Optional[pd.DataFrame], template_wb: Optional[str], log_path: Optional[str], esc_future) -> tuple:
+    """Steps 1-7 of run_pipeline; returns (rows kept for allocation, warnings)."""
+    # --- Step 1: Load Help sheet mappings (once, every input chunk needs them) ---
+    print("Loading Help sheet mappings...")
+    help_cache_dir = os.path.dirname(log_path) if log_path else None
+    help_df, provider_to_location, visit_type_to_workable, excluded_primary = load_help_sheet(template_wb, cache_dir=help_cache_dir)
+    # Normalize the lookups at the boundary (check_workable_and_exclusions relies on this form)
+    visit_type_to_workable = {str(k).strip().upper(): str(v).strip().upper() for k, v in visit_type_to_workable.items()}
+    excluded_primary = frozenset(str(s).strip().upper() for s in excluded_primary)
+
+    def filter_chunk(df: pd.DataFrame, esc_accounts: Optional[frozenset]):
+        """Steps 2-4 and 6-7 on one piece of the input; returns (kept rows, warnings)."""
+        # --- Step 2: Normalize the cleaned macro output ---
+        df = _normalize_columns(df)
+        for col in _CATEGORY_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].astype("category")
+        # Normalized Visit Status / Visit Type / Primary Insurance / account number, computed once for all filters
+        norm = _normalized_sidecar(df)
+
+        # --- Steps 3-4: Visit Status Filter (exclude INS VER) + remove WC from Primary Insurance Name ---
+        df = apply_visit_status_and_wc_filters(df, norm=norm)
+
+        # --- Step 6: Workable + Primary Insurance exclusions + escalation (BEFORE ALLOCATION PRIORITY), one pass ---
+        df, warn = check_workable_and_exclusions(df, visit_type_to_workable, excluded_primary, esc_accounts=esc_accounts, norm=norm)
+
+        # --- Step 7: Map Appointment Location (from Help sheet) ---
+        # No filter reads it, so only the kept rows and the (few) warning rows are mapped
+        if "Appointment Provider Name" in df.columns and provider_to_location:
+            df = _map_appointment_location(df, provider_to_location)
+            if not warn.empty:
+                warn = _map_appointment_location(warn, provider_to_location)
+        return df, warn
+
+    # --- Step 2: Read cleaned macro output ---
+    if cleaned_df is not None:
+        print("Using cleaned macro output from memory...")
+        chunks = [cleaned_df]
+    else:
+        print("Loading cleaned macro output...")
+        chunks = _iter_input(cleaned_file)
 
-def run_pipeline(cleaned_file: str, template_wb: Optional[str], out_dir: str, escalation_file_path: Optional[str] = None, log_path: Optional[str] = None):
-    """
-    Run full pipeline after macro cleanup.
-    Steps:
-      1. Read cleaned macro output and normalize.
-      2. Apply Visit Status filter (exclude INS VER : Insurance Verified).
-      3. Remove WC from Visit Type.
-      4. Load Help sheet mappings.
-      5. Map Appointment Location (provider -> state).
-      6. Apply workable + excluded primary insurance filters.
-      7. Apply escalation filter (Acc# comparison) - BEFORE allocation priority.
-      8. Perform allocation + agent assignment.
-      9. Build final HX CSV + debug logs.
-    """
-    print("Loading cleaned macro output...")
-    df = _read_excel_auto(cleaned_file)
-    df = _normalize_columns(df)
+    # CSV input is streamed, so only the rows surviving steps 3-6 are held across chunks;
+    # allocation needs every row at once and runs on the combined result
+    chunk_iter = iter(chunks)
+    first = next(chunk_iter, None)
 
-    # --- Step 1: Visit Status Filter (exclude INS VER) ---
-    print("Applying Visit Status filter (exclude INS VER)...")
-    df = apply_visit_status_filter(df)
+    # Steps 3-7 announce themselves once here; each chunk then prints only its own counts
+    print("Applying Visit Status filter (exclude INS VER) and removing WC from Primary Insurance Name...")
 
-    # --- Step 2: Remove WC from Primary Insurance Name ---
-    print("Removing WC from Primary Insurance Name...")
-    df = remove_wc_visit_type(df)
+    # --- Step 5: Load escalation accounts (Acc# comparison) ---
+    # Waited on once, after the first chunk's read overlapped the load; a loader error surfaces here
+    esc_accounts = None
+    if esc_future is not None:
+        print("Applying escalation filter (Acc# comparison)...")
+        esc_accounts = esc_future.result()
+    else:
+        print("No escalation file provided, skipping escalation filter.")
+    print("Checking Workable status and excluded Primary Insurance Names...")
 
-    # --- Step 3: Load Help sheet mappings ---
-    print("Loading Help sheet mappings...")
-    help_df, provider_to_location, visit_type_to_workable, excluded_primary = load_help_sheet(template_wb)
-
-    # --- Step 4: Map Appointment Location (from Help sheet) ---
-    if "Appointment Provider Name" in df.columns and provider_to_location:
-        df["Appointment Location"] = (
-            df["Appointment Provider Name"]
-            .astype(str)
-            .str.strip()
-            .str.upper()
-            .map(provider_to_location)
-        )
+    if first is not None:
+        chunk_iter = itertools.chain([first], chunk_iter)
+    kept, warn_parts = [], []
+    for chunk in chunk_iter:
+        df_part, warn_part = filter_chunk(chunk, esc_accounts)
+        kept.append(df_part)
+        if not warn_part.empty:
+            warn_parts.append(warn_part)
+    # Chunks that lost every row add nothing but would sway the concat's dtypes (deprecated in pandas)
+    kept = [part for part in kept if not part.empty] or kept[:1]
+    df_filtered = pd.concat(kept, ignore_index=True, copy=False) if len(kept) > 1 else kept[0]
+    warnings = pd.concat(warn_parts, ignore_index=True, copy=False) if warn_parts else pd.DataFrame(columns=["_warning_reason"])
+
+    if "Appointment Provider Name" in df_filtered.columns and provider_to_location:
         print("Appointment Location mapped from Help sheet.")
     else:
         print("Could not map Appointment Location — provider names not found in Help sheet.")
+    return df_filtered, warnings
 
-    # --- Step 5: Apply Workable and Primary Insurance exclusions ---
-    print("Checking Workable status and excluded Primary Insurance Names...")
-    df_filtered, warnings = check_workable_and_exclusions(df, visit_type_to_workable, excluded_primary)
 
-    # --- Step 6: Apply Escalation Filtering (BEFORE ALLOCATION PRIORITY) ---
-    if escalation_file_path:
-        print("Applying escalation filter (Acc# comparison)...")
-        df_filtered = apply_escalation_filter(df_filtered, escalation_file_path)
-    else:
-        print("No escalation file provided, skipping escalation filter.")
+# ---------- Main Pipeline ----------
+from macro import audentes_verification_cleaned
 
-    # --- Step 7: Allocation + Agent assignment ---
+def run_pipeline(cleaned_file: Optional[str], template_wb: Optional[str], out_dir: str, escalation_file_path: Optional[str] = None, log_path: Optional[str] = None, cleaned_df: Optional[pd.DataFrame] = None):
+    """
+    Run full pipeline after macro cleanup.
+    Steps:
+      1. Load Help sheet mappings.
+      2. Read cleaned macro output (or use cleaned_df when passed in memory) and normalize.
+      3. Apply Visit Status filter (exclude INS VER : Insurance Verified).
+      4. Remove WC from Visit Type.
+      5. Load escalation accounts (Acc# comparison).
+      6. Apply workable + excluded primary insurance + escalation filters in one pass - BEFORE allocation priority.
+      7. Map Appointment Location (provider -> state) on the rows that are left.
+      8. Perform allocation + agent assignment.
+      9. Build final HX CSV + debug logs.
+
+    The escalation file is read on a background thread from the start, overlapping
+    the Help sheet load and the read of the first (or only) input chunk.
+    A CSV cleaned output is read in chunks of _INPUT_CHUNK_ROWS rows, each taken
+    through steps 2-4 and 6-7 on its own before allocation runs on the surviving rows;
+    per-chunk filter counts are printed once per chunk.
+    """
+    esc_pool = ThreadPoolExecutor(max_workers=1)
+    esc_future = esc_pool.submit(_load_escalation_accounts, escalation_file_path) if escalation_file_path else None
+    try:
+        df_filtered, warnings = _filter_input(cleaned_file, cleaned_df, template_wb, log_path, esc_future)
+    finally:
+        # The loader never outlives this call, whether the filters finished or raised
+        if esc_future is not None:
+            esc_future.cancel()
+        esc_pool.shutdown(wait=True)
+
+    # --- Step 8: Allocation + Agent assignment ---
     df_alloc = _assign_allocation_priority(df_filtered)
     df_agents = assign_agents(df_alloc)
 
-    # --- Step 8: Build final HX output ---
-    print("Building final HX file...")
-    out_path = build_hx_csv(df_agents, out_dir, get_hx_field_mapping())
-
-    # --- Step 9: Save warnings and debug ---
+    # --- Step 9: Build final HX output, save warnings and debug ---
     warnings_path = os.path.join(out_dir, "warnings.csv")
-    if warnings is not None and not warnings.empty:
-        warnings.to_csv(warnings_path, index=False)
-    else:
-        pd.DataFrame(columns=["_warning_reason"]).to_csv(warnings_path, index=False)
+    if warnings is None or warnings.empty:
+        warnings = pd.DataFrame(columns=["_warning_reason"])
 
     debug_cols = [
         "Patient Account Number", "Patient Name", "Appointment Provider Name",
@@ -839,9 +1233,24 @@ def run_pipeline(cleaned_file: str, template_wb: Optional[str], out_dir: str, es
         "Allocation Group", "Allocation Priority", "_alloc_seq", "Assigned Agent"
     ]
     existing_debug_cols = [c for c in debug_cols if c in df_agents.columns]
-    debug_df = df_agents[existing_debug_cols] if existing_debug_cols else df_agents.head(0)
     debug_path = os.path.join(out_dir, "allocation_debug.csv")
-    debug_df.to_csv(debug_path, index=False)
+    # Only the debug columns are converted; with none of them present, all headers and no rows
+    debug_src = df_agents if existing_debug_cols else df_agents.head(0)
+
+    # The three files are independent, so they are written concurrently; warnings and debug
+    # keep pandas' CSV format like the HX file (quoting only where needed, floats as 1.0)
+    print("Building final HX file...")
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        # HX output only reads its mapped source columns; the internal allocation columns stay behind
+        hx_mapping = get_hx_field_mapping()
+        hx_future = pool.submit(build_hx_csv, df_agents[_hx_source_columns(df_agents, hx_mapping)], out_dir, hx_mapping)
+        side_writes = [
+            pool.submit(warnings.to_csv, warnings_path, index=False),
+            pool.submit(debug_src.to_csv, debug_path, index=False, columns=existing_debug_cols or None),
+        ]
+    out_path = hx_future.result()
+    for fut in side_writes:
+        fut.result()
 
     print(f" HX file ready: {out_path}")
     print(f" Warnings: {warnings_path}")
@@ -0,0 +1,273 @@
+import os
+import sys
+import time
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import process_data  # noqa: E402
+
+pytest.importorskip("pyarrow")
+
+
+def _arrow_frame(rows: dict) -> pd.DataFrame:
+    return pd.DataFrame(rows).astype("string[pyarrow]")
+
+
+def _two_chunk_frame() -> pd.DataFrame:
+    # Concatenating Arrow-backed frames (as macro.py does for CSV chunks) gives multi-chunk columns
+    first = _arrow_frame({
+        "Patient Name": ["Doe, Jane", "Roe, Rick"],
+        "Patient Acct No": ["100", "101"],
+        "Appointment Provider Name": [" Smith, Ann", "Jones, Bob "],
+        "Appointment Date": ["07/01/2025", "07/02/2025"],
+        "Visit Type": ["NP : New Patient", "FU : Follow Up"],
+        "Visit Status": ["PEN : Pending", "PR : Pending Referral"],
+        "Primary Insurance Name": ["Aetna", "Cigna"],
+    })
+    second = _arrow_frame({
+        "Patient Name": ["Poe, Ed", "Moe, Al"],
+        "Patient Acct No": ["102", "103"],
+        "Appointment Provider Name": ["smith, ann", "Jones, Bob"],
+        "Appointment Date": ["07/03/2025", "07/04/2025"],
+        "Visit Type": ["FU : Follow Up", "NP : New Patient"],
+        "Visit Status": ["PEN : Pending", "INS VER : Insurance Verified"],
+        "Primary Insurance Name": ["Aetna WC", "Cigna"],
+    })
+    return pd.concat([first, second], ignore_index=True)
+
+
+def test_upper_categories_multi_chunk_arrow_column():
+    df = _two_chunk_frame()
+    assert df["Appointment Provider Name"].array._pa_array.num_chunks == 2
+
+    result = process_data._upper_categories(df["Appointment Provider Name"])
+
+    assert result.tolist() == ["SMITH, ANN", "JONES, BOB", "SMITH, ANN", "JONES, BOB"]
+    stripped = process_data._upper_categories(df["Appointment Provider Name"], upper=False)
+    assert stripped.tolist() == ["Smith, Ann", "Jones, Bob", "smith, ann", "Jones, Bob"]
+
+
+def test_run_pipeline_multi_chunk_cleaned_df(tmp_path):
+    help_path = tmp_path / "template.xlsx"
+    pd.DataFrame({
+        "Appointment Provider Name": ["Smith, Ann", "Jones, Bob"],
+        "Appointment State": ["CO", "TX"],
+        "Visit Type": ["NP : New Patient", "FU : Follow Up"],
+        "Workable": ["Y", "Y"],
+        "Primary Insurance Name": ["Medicare", ""],
+    }).to_excel(help_path, sheet_name="Help", index=False)
+
+    out_dir = tmp_path / "out"
+    result = process_data.run_pipeline(None, str(help_path), str(out_dir), cleaned_df=_two_chunk_frame())
+
+    # INS VER and WC rows are dropped; the rest are mapped and allocated
+    assert result["processed_count"] == 2
+    debug = pd.read_csv(result["debug"], dtype=str, keep_default_na=False)
+    assert sorted(debug["Appointment Location"]) == ["CO", "TX"]
+    # Internal CSVs keep pandas' format: bare headers, quoting only where a field needs it
+    with open(result["debug"], encoding="utf-8") as f:
+        assert f.readline().startswith("Patient Name,Appointment Provider Name,")
+    with open(result["warnings"], encoding="utf-8") as f:
+        assert f.read() == "_warning_reason\n"
+
+
+def test_run_pipeline_streams_csv_input_in_chunks(tmp_path, monkeypatch, capsys):
+    help_path = tmp_path / "template.xlsx"
+    _help_template(help_path, {"Smith, Ann": "CO", "Jones, Bob": "TX"})
+    cleaned_csv = tmp_path / "cleaned.csv"
+    _two_chunk_frame().to_csv(cleaned_csv, index=False)
+
+    in_memory = process_data.run_pipeline(None, str(help_path), str(tmp_path / "mem"), cleaned_df=_two_chunk_frame())
+    capsys.readouterr()
+    monkeypatch.setattr(process_data, "_INPUT_CHUNK_ROWS", 3)
+    streamed = process_data.run_pipeline(str(cleaned_csv), str(help_path), str(tmp_path / "csv"))
+
+    assert streamed["processed_count"] == in_memory["processed_count"] == 2
+    pd.testing.assert_frame_equal(
+        pd.read_csv(streamed["debug"], dtype=str, keep_default_na=False),
+        pd.read_csv(in_memory["debug"], dtype=str, keep_default_na=False),
+    )
+    # Two chunks: per-chunk counts twice, step announcements once
+    out = capsys.readouterr().out
+    assert out.count("Visit Status filter (exclude INS VER):") == 2
+    assert out.count("Checking Workable status") == 1
+    assert out.count("Appointment Location mapped from Help sheet.") == 1
+
+
+def test_build_hx_csv_keeps_pandas_quoting(tmp_path):
+    df = _arrow_frame({
+        "Patient Name": ["Doe, Jane"],
+        "Primary Insurance Name": ["Aetna"],
+        "Allocation Priority": ["NP001"],
+    })
+    mapping = {"Organization": "Audentes_Verification", "Primary Insurance Name": "Primary Insurance Name",
+               "Patient Name": "Patient Name", "Allocation Priority": None}
+
+    out_path = process_data.build_hx_csv(df, str(tmp_path), mapping)
+
+    with open(out_path, "r", encoding="utf-8") as f:
+        assert f.read().splitlines() == [
+            "Organization,Primary Insurance Name,Patient Name,Allocation Priority",
+            'Audentes_Verification,Aetna,"Doe, Jane",NP001',
+        ]
+
+
+def test_read_excel_auto_ignores_parquet_cache_for_replaced_source(tmp_path, monkeypatch):
+    path = tmp_path / "cleaned.xlsx"
+    pd.DataFrame({"Patient Name": ["First"]}).to_excel(path, index=False)
+    assert process_data._read_excel_auto(str(path))["Patient Name"].tolist() == ["First"]
+    assert os.path.isfile(f"{path}.parquet")
+
+    # Served from the cache while the workbook is unchanged
+    with monkeypatch.context() as m:
+        m.setattr(process_data.pd, "read_excel", lambda *a, **k: pytest.fail("workbook re-parsed"))
+        assert process_data._read_excel_auto(str(path))["Patient Name"].tolist() == ["First"]
+
+    # Replace the workbook with one carrying an older mtime than the cache
+    pd.DataFrame({"Patient Name": ["Second", "Third"]}).to_excel(path, index=False)
+    old = os.path.getmtime(f"{path}.parquet") - 3600
+    os.utime(path, (old, old))
+
+    assert process_data._read_excel_auto(str(path))["Patient Name"].tolist() == ["Second", "Third"]
+
+
+def test_run_pipeline_leaves_cleaned_df_untouched(tmp_path):
+    help_path = tmp_path / "template.xlsx"
+    pd.DataFrame({
+        "Appointment Provider Name": ["Smith, Ann"],
+        "Appointment State": ["CO"],
+        "Visit Type": ["FU : Follow Up"],
+        "Workable": ["N"],
+        "Primary Insurance Name": ["Cigna"],
+    }).to_excel(help_path, sheet_name="Help", index=False)
+    cleaned = _two_chunk_frame()
+    before = cleaned.copy()
+
+    # Filters must not rely on pandas' Copy-on-Write mode to avoid writing into their input
+    with pd.option_context("mode.copy_on_write", False):
+        process_data.run_pipeline(None, str(help_path), str(tmp_path / "out"), cleaned_df=cleaned)
+
+    pd.testing.assert_frame_equal(cleaned, before)
+
+
+def test_empty_warnings_result_is_a_fresh_frame():
+    df = pd.DataFrame({"Visit Type": ["NP : New Patient"], "Primary Insurance Name": ["Aetna"]})
+    _, warn = process_data.check_workable_and_exclusions(df, {"NP : NEW PATIENT": "Y"}, frozenset())
+    warn["Appointment Location"] = []
+
+    _, warn_again = process_data.check_workable_and_exclusions(df, {"NP : NEW PATIENT": "Y"}, frozenset())
+    assert warn_again is not warn
+    assert list(warn_again.columns) == ["_warning_reason"]
+
+
+def test_check_workable_and_exclusions_applies_masks_in_step_order(capsys):
+    df = pd.DataFrame({
+        "Patient Account Number": ["1", "2", "3", "4"],
+        "Visit Type": ["NP : New Patient", "NP : New Patient", "FU : Follow Up", "FU : Follow Up"],
+        "Primary Insurance Name": ["Medicare", "Aetna", "Medicare", "Aetna"],
+    })
+
+    kept, warn = process_data.check_workable_and_exclusions(
+        df, {"NP : NEW PATIENT": "N", "FU : FOLLOW UP": "Y"}, frozenset({"MEDICARE"}), esc_accounts=frozenset({"1", "4"})
+    )
+
+    # Row 1 is Workable = N first; escalated rows are dropped without a warning row
+    assert kept["Patient Account Number"].tolist() == []
+    assert warn["Patient Account Number"].tolist() == ["1", "2", "3"]
+    assert warn["_warning_reason"].tolist() == ["Workable = N (from Help sheet)"] * 2 + ["Excluded Primary Insurance"]
+    assert "Escalation filter removed 1 rows (from 1 to 0)" in capsys.readouterr().out
+
+
+def test_run_pipeline_surfaces_escalation_loader_failure(tmp_path, monkeypatch):
+    help_path = tmp_path / "template.xlsx"
+    _help_template(help_path, {"Smith, Ann": "CO"})
+    monkeypatch.setattr(process_data, "_load_escalation_accounts", lambda path: 1 / 0)
+
+    with pytest.raises(ZeroDivisionError):
+        process_data.run_pipeline(None, str(help_path), str(tmp_path / "out"), escalation_file_path="esc.csv", cleaned_df=_two_chunk_frame())
+
+
+def test_run_pipeline_waits_for_escalation_loader_on_error(tmp_path, monkeypatch):
+    finished = []
+
+    def slow_loader(path):
+        time.sleep(0.2)
+        finished.append(path)
+        return frozenset()
+
+    def broken_help(*args, **kwargs):
+        raise RuntimeError("Help sheet unreadable")
+
+    monkeypatch.setattr(process_data, "_load_escalation_accounts", slow_loader)
+    monkeypatch.setattr(process_data, "load_help_sheet", broken_help)
+
+    with pytest.raises(RuntimeError):
+        process_data.run_pipeline(None, "template.xlsx", str(tmp_path / "out"), escalation_file_path="esc.csv", cleaned_df=_two_chunk_frame())
+    # The background load was joined before the error left run_pipeline
+    assert finished == ["esc.csv"]
+
+
+def _help_template(path, provider_state):
+    pd.DataFrame({
+        "Appointment Provider Name": list(provider_state),
+        "Appointment State": list(provider_state.values()),
+        "Visit Type": ["NP : New Patient"] * len(provider_state),
+        "Workable": ["Y"] * len(provider_state),
+        "Primary Insurance Name": ["Medicare"] * len(provider_state),
+    }).to_excel(path, sheet_name="Help", index=False)
+
+
+def test_help_cache_shared_by_macro_and_pipeline(tmp_path, monkeypatch):
+    import macro
+
+    template = tmp_path / "template.xlsx"
+    _help_template(template, {"Smith, Ann": "CO"})
+    cache_dir = tmp_path / "logs"
+
+    _, provider_to_location, _, excluded = process_data.load_help_sheet(str(template), cache_dir=str(cache_dir))
+    raw = macro._read_help(str(template), cache_dir=str(cache_dir))
+    assert os.listdir(cache_dir) == ["help_cache_v2.json"]
+
+    monkeypatch.setattr(process_data, "_parse_help_sheet", lambda *a: pytest.fail("Help sheet re-parsed"))
+    monkeypatch.setattr(macro.pd, "read_excel", lambda *a, **k: pytest.fail("Help sheet re-read"))
+    cached = process_data.load_help_sheet(str(template), cache_dir=str(cache_dir))
+    assert cached[1] == provider_to_location == {"SMITH, ANN": "CO"}
+    assert cached[3] == excluded == frozenset({"MEDICARE"})
+    pd.testing.assert_frame_equal(macro._read_help(str(template), cache_dir=str(cache_dir)), raw)
+
+
+def test_help_cache_ignores_stale_and_old_format_entries(tmp_path):
+    template = tmp_path / "template.xlsx"
+    _help_template(template, {"Smith, Ann": "CO"})
+    cache_dir = tmp_path / "logs"
+    cache_dir.mkdir()
+    # Leftovers of earlier cache formats; the pickle must never be loaded
+    for name in ("help_cache_0123.pkl", "help_raw_cache_0123.pkl", "help_cache_v1.json"):
+        (cache_dir / name).write_bytes(b"not a current cache")
+
+    assert process_data.load_help_sheet(str(template), cache_dir=str(cache_dir))[1] == {"SMITH, ANN": "CO"}
+    assert os.listdir(cache_dir) == ["help_cache_v2.json"]
+
+    # Same path, new content: the cached entry no longer matches and is replaced
+    _help_template(template, {"Jones, Bob": "TX"})
+    assert process_data.load_help_sheet(str(template), cache_dir=str(cache_dir))[1] == {"JONES, BOB": "TX"}
+    assert os.listdir(cache_dir) == ["help_cache_v2.json"]
+
+
+def test_read_excel_auto_rewrites_corrupt_or_unstamped_parquet_cache(tmp_path):
+    path = tmp_path / "cleaned.xlsx"
+    pd.DataFrame({"Patient Name": ["Fresh"]}).to_excel(path, index=False)
+    sidecar = f"{path}.parquet"
+
+    # A sidecar from before the source stamp existed is never trusted
+    pd.DataFrame({"Patient Name": ["Stale"]}).to_parquet(sidecar, index=False)
+    assert process_data._read_excel_auto(str(path))["Patient Name"].tolist() == ["Fresh"]
+
+    with open(sidecar, "wb") as f:
+        f.write(b"not parquet")
+    assert process_data._read_excel_auto(str(path))["Patient Name"].tolist() == ["Fresh"]
+    # Rewritten with the current stamp, so the next read is served from it
+    assert process_data.pq.read_schema(sidecar).metadata[process_data._SOURCE_STAMP_KEY] == process_data._source_stamp(str(path))
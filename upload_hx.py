@@ -1,27 +1,38 @@
+import atexit
 import json
 import os
-import time
 import traceback
 from datetime import datetime
+from functools import lru_cache
 from typing import Tuple
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from webdriver_manager.chrome import ChromeDriverManager
 
+# Browser session shared by consecutive uploads (keyed on portal URL + user), quit at exit
+_DRIVER = None
+_DRIVER_KEY = None
+
+# Where the resolved ChromeDriver binary path is remembered between runs
+_DRIVER_PATH_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "hx_driver_path")
+
 
 def _log(message: str, log_path: str = None) -> None:
+    # hx_upload creates the log directory once up front
     if not log_path:
         return
-    os.makedirs(os.path.dirname(log_path), exist_ok=True)
     with open(log_path, "a", encoding="utf-8") as f:
         ts = datetime.now().strftime("%H:%M:%S")
         f.write(f"[{ts}] {message}\n")
 
 
+@lru_cache(maxsize=1)
 def _load_config() -> dict:
+    """config.json from the working directory, read once per process (treat the result as read-only)."""
     cfg_path = os.path.join(os.getcwd(), "config.json")
     if not os.path.isfile(cfg_path):
         raise FileNotFoundError(f"config.json not found at {cfg_path}")
@@ -35,9 +46,135 @@ def _resolve_secret(value: str) -> str:
     return value
 
 
+@lru_cache(maxsize=1)
+def _chromedriver_path() -> str:
+    """ChromeDriver binary (once per process), resolved through webdriver_manager only when the cached path is gone."""
+    try:
+        with open(_DRIVER_PATH_CACHE, "r", encoding="utf-8") as f:
+            cached = f.read().strip()
+        if cached and os.path.isfile(cached):
+            return cached
+    except OSError:
+        pass
+    path = ChromeDriverManager().install()
+    try:
+        os.makedirs(os.path.dirname(_DRIVER_PATH_CACHE), exist_ok=True)
+        with open(_DRIVER_PATH_CACHE, "w", encoding="utf-8") as f:
+            f.write(path)
+    except OSError:
+        pass
+    return path
+
+
+def _forget_chromedriver_path() -> None:
+    """Drop the remembered ChromeDriver path (file and memo) so the next lookup re-resolves it."""
+    _chromedriver_path.cache_clear()
+    try:
+        os.remove(_DRIVER_PATH_CACHE)
+    except OSError:
+        pass
+
+
+def _quit_driver() -> None:
+    global _DRIVER, _DRIVER_KEY
+    if _DRIVER:
+        try:
+            _DRIVER.quit()
+        except Exception:
+            pass
+    _DRIVER = None
+    _DRIVER_KEY = None
+
+
+atexit.register(_quit_driver)
+
+
+def _login(driver, wait: WebDriverWait, username: str, password: str) -> None:
+    wait.until(EC.presence_of_element_located((By.ID, "email"))).send_keys(username)
+    wait.until(EC.presence_of_element_located((By.ID, "password"))).send_keys(password)
+    wait.until(EC.element_to_be_clickable((By.XPATH, '//input[@value="Sign in"]'))).click()
+
+
+def _get_driver(hx_url: str, username: str, password: str, log_path: str = None):
+    """Return a logged-in driver on the HealthX landing page, reusing the previous upload's session."""
+    global _DRIVER, _DRIVER_KEY
+    key = (hx_url, username)
+    if _DRIVER is not None and _DRIVER_KEY == key:
+        try:
+            _log(f"Reusing HealthX session: {hx_url}", log_path)
+            _DRIVER.get(hx_url)
+            # Sign in again only if the session has expired (no implicit wait for the absent form)
+            _DRIVER.implicitly_wait(0)
+            needs_login = bool(_DRIVER.find_elements(By.ID, "email"))
+            _DRIVER.implicitly_wait(10)
+            if needs_login:
+                _login(_DRIVER, WebDriverWait(_DRIVER, 60), username, password)
+            return _DRIVER
+        except Exception as exc:
+            _log(f"Previous browser session unusable ({exc}), starting a new one...", log_path)
+    _quit_driver()
+
+    _log("Setting up Chrome browser...", log_path)
+    chrome_options = webdriver.ChromeOptions()
+    chrome_options.add_argument('--log-level=3')
+    chrome_options.add_argument('--start-maximized')
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    chrome_options.add_experimental_option('prefs', {
+        "profile.default_content_settings.popups": 0,
+        "download.prompt_for_download": False,
+        "directory_upgrade": True
+    })
+    # Increase timeout for ChromeDriver connection
+    try:
+        driver = webdriver.Chrome(service=Service(_chromedriver_path()), options=chrome_options)
+    except WebDriverException as exc:
+        # A remembered driver goes stale when Chrome updates itself: resolve it again and retry once
+        _log(f"ChromeDriver failed to start ({exc}), resolving the driver again...", log_path)
+        _forget_chromedriver_path()
+        driver = webdriver.Chrome(service=Service(_chromedriver_path()), options=chrome_options)
+    _DRIVER, _DRIVER_KEY = driver, key
+    driver.set_page_load_timeout(300)  # 5 minutes for page load
+    driver.implicitly_wait(10)  # Implicit wait for elements
+
+    _log(f"Navigating to HealthX: {hx_url}", log_path)
+    driver.get(hx_url)
+    _login(driver, WebDriverWait(driver, 60), username, password)
+    return driver
+
+
+def _normalize_option(value: str) -> str:
+    """Normalize text for matching (lowercase, alphanumeric only)."""
+    return "".join(ch.lower() for ch in value if ch.isalnum())
+
+
+# Finds the first select2 option containing arguments[0] or whose normalized label
+# (lowercase, letters/digits only, as _normalize_option) starts with arguments[1].
+# Returns {element, matched: label}, or {available: first five labels} when nothing matches.
+# The click itself goes through WebDriver: select2 selects on real mouse events, not a scripted click().
+_SELECT_OPTION_JS = """
+const labels = [];
+for (const el of document.querySelectorAll('li.select2-results__option')) {
+    const text = (el.innerText || '').trim();
+    if (!text) continue;
+    labels.push(text);
+    const normalized = text.toLowerCase().replace(/[^\\p{L}\\p{N}]/gu, '');
+    if (text.includes(arguments[0]) || normalized.startsWith(arguments[1])) {
+        return {element: el, matched: text};
+    }
+}
+return {available: labels.slice(0, 5)};
+"""
+
+
 def hx_upload(file_path: str, log_path: str = None) -> Tuple[bool, str]:
-    """Upload file to HealthX portal using Selenium and return success flag/message."""
-    driver = None
+    """Upload file to HealthX portal using Selenium and return success flag/message.
+
+    The logged-in browser is kept open for the next upload and closed at exit
+    (or after a failed upload, since its page state is then unknown).
+    """
+    if log_path:
+        os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
     try:
         if not os.path.isfile(file_path):
             msg = f"Upload file not found: {file_path}"
@@ -55,109 +192,67 @@ def hx_upload(file_path: str, log_path: str = None) -> Tuple[bool, str]:
             _log(f"ERROR: {msg}", log_path)
             return False, msg
 
-        _log("Setting up Chrome browser...", log_path)
-        chrome_options = webdriver.ChromeOptions()
-        chrome_options.add_argument('--log-level=3')
-        chrome_options.add_argument('--start-maximized')
-        chrome_options.add_argument('--no-sandbox')
-        chrome_options.add_argument('--disable-dev-shm-usage')
-        chrome_options.add_experimental_option('prefs', {
-            "profile.default_content_settings.popups": 0,
-            "download.prompt_for_download": False,
-            "directory_upgrade": True
-        })
-        service = Service(ChromeDriverManager().install())
-        # Increase timeout for ChromeDriver connection
-        driver = webdriver.Chrome(service=service, options=chrome_options)
-        driver.set_page_load_timeout(300)  # 5 minutes for page load
-        driver.implicitly_wait(10)  # Implicit wait for elements
+        driver = _get_driver(hx_url, username, password, log_path)
         wait = WebDriverWait(driver, 60)  # Increased explicit wait timeout
 
-        _log(f"Navigating to HealthX: {hx_url}", log_path)
-        driver.get(hx_url)
-        wait.until(EC.presence_of_element_located((By.ID, "email"))).send_keys(username)
-        wait.until(EC.presence_of_element_located((By.ID, "password"))).send_keys(password)
-        wait.until(EC.element_to_be_clickable((By.XPATH, '//input[@value="Sign in"]'))).click()
-
+        # Each step waits only until the element the next action needs is ready
         _log("Navigating to Import screen...", log_path)
-        time.sleep(5)
         wait.until(EC.element_to_be_clickable((By.XPATH, '//*[@id="sidebar-toggle"]/li[5]/a'))).click()
-        time.sleep(3)
         wait.until(EC.element_to_be_clickable((By.XPATH, '//*[@id="EVSummary"]/li[1]/a'))).click()
-        time.sleep(5)
 
         _log(f"Selecting campaign: {client_text}", log_path)
         wait.until(EC.element_to_be_clickable((By.XPATH, '//*[@id="select2-campaign-container"]'))).click()
-        time.sleep(2)
-        
-        # Wait for dropdown options to appear, then find matching option
-        wait.until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, 'li.select2-results__option')))
-        time.sleep(1)  # Give dropdown time to fully render
-        
-        def _normalize_option(value: str) -> str:
-            """Normalize text for matching (lowercase, alphanumeric only)."""
-            return "".join(ch.lower() for ch in value if ch.isalnum())
-        
-        normalized_target = _normalize_option(client_text)
-        options = driver.find_elements(By.CSS_SELECTOR, 'li.select2-results__option')
-        matched = False
-        
-        for opt in options:
-            text = opt.text or ""
-            if not text.strip():
-                continue
-            # Try exact match first, then normalized match
-            if client_text.strip() in text or _normalize_option(text).startswith(normalized_target):
-                try:
-                    opt.click()
-                    matched = True
-                    _log(f"Selected option: {text}", log_path)
-                    break
-                except Exception as e:
-                    _log(f"Failed to click option '{text}': {e}", log_path)
-                    continue
         
+        # Wait for the dropdown's real options (not select2's "Searching..." placeholder), then find matching option
+        wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, 'li.select2-results__option:not(.loading-results)')))
+
+        # Match in the browser (one driver round-trip for the whole option list), click natively
+        result = driver.execute_script(_SELECT_OPTION_JS, client_text.strip(), _normalize_option(client_text)) or {}
+        matched = result.get("matched")
         if not matched:
-            available = [opt.text for opt in options[:5] if opt.text.strip()]
+            available = result.get("available") or []
             error_msg = f"Client option '{client_text}' not found in dropdown. Available options: {available}"
             _log(f"ERROR: {error_msg}", log_path)
             raise Exception(error_msg)
-        
-        time.sleep(2)
+        result["element"].click()
+
+        # Confirm select2 actually took the selection before uploading against it; the rendered
+        # title/text and the option's innerText may differ in case or spacing, so both sides are
+        # compared in _normalize_option form (the rule the option was matched by)
+        def _rendered_campaign(d) -> str:
+            container = d.find_element(By.ID, "select2-campaign-container")
+            return (container.get_attribute("title") or container.text or "").replace("\u00d7", "").strip()
+
+        expected = _normalize_option(matched)
+        try:
+            wait.until(lambda d: _normalize_option(_rendered_campaign(d)) == expected)
+        except TimeoutException:
+            error_msg = f"Campaign '{matched}' was clicked but not selected (dropdown shows '{_rendered_campaign(driver)}')"
+            _log(f"ERROR: {error_msg}", log_path)
+            raise Exception(error_msg)
+        _log(f"Selected option: {matched}", log_path)
 
         _log("Uploading file to portal...", log_path)
         file_input = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="customFile"]')))
         file_input.send_keys(os.path.abspath(file_path))
-        time.sleep(3)
         wait.until(EC.element_to_be_clickable((By.XPATH, '//*[@id="ImportButtonRed"]'))).click()
 
         _log("Awaiting upload confirmation...", log_path)
-        start = time.time()
-        success = False
         max_wait = 300  # 5 minutes for upload confirmation
-        while time.time() - start < max_wait:
-            time.sleep(3)
-            try:
-                # Try multiple possible success message patterns
-                success_patterns = [
-                    '//p[contains(@class, "message") and contains(text(), "uploaded Successfully")]',
-                    '//p[contains(@class, "message") and contains(text(), "uploaded successfully")]',
-                    '//p[contains(@class, "message") and contains(text(), "Successfully")]',
-                    '//*[contains(text(), "uploaded Successfully")]',
-                    '//*[contains(text(), "uploaded successfully")]'
-                ]
-                for pattern in success_patterns:
-                    try:
-                        wait.until(EC.presence_of_element_located((By.XPATH, pattern)))
-                        success = True
-                        break
-                    except:
-                        continue
-                if success:
-                    break
-            except Exception as e:
-                _log(f"Checking for upload confirmation... ({int(time.time() - start)}s elapsed)", log_path)
-                pass
+        # Possible success message patterns, checked together as one XPath union
+        success_patterns = [
+            '//p[contains(@class, "message") and contains(text(), "uploaded Successfully")]',
+            '//p[contains(@class, "message") and contains(text(), "uploaded successfully")]',
+            '//p[contains(@class, "message") and contains(text(), "Successfully")]',
+            '//*[contains(text(), "uploaded Successfully")]',
+            '//*[contains(text(), "uploaded successfully")]'
+        ]
+        success_xpath = " | ".join(success_patterns)
+        try:
+            WebDriverWait(driver, max_wait).until(EC.presence_of_element_located((By.XPATH, success_xpath)))
+            success = True
+        except TimeoutException:
+            success = False
 
         if not success:
             _log(f"Upload confirmation not detected within {max_wait}s timeout. Proceeding anyway...", log_path)
@@ -167,20 +262,24 @@ def hx_upload(file_path: str, log_path: str = None) -> Tuple[bool, str]:
 
         _log("Navigating to EV Allocation...", log_path)
         wait.until(EC.element_to_be_clickable((By.XPATH, '//*[@id="EVSummary"]/li[2]/a'))).click()
-        time.sleep(6)
+        initiate_locator = (By.XPATH, '//*[@id="newrecord_evprocess"]/div/a')
+        wait.until(EC.presence_of_element_located(initiate_locator))
         driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(3)
-        initiate_btn = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="newrecord_evprocess"]/div/a')))
-        initiate_btn.click()
-        time.sleep(3)
+        wait.until(EC.element_to_be_clickable(initiate_locator)).click()
 
         try:
-            wait.until(EC.presence_of_element_located((By.XPATH, '//button[@id="InitiateConfirmAction"]'))).click()
+            confirm_locator = (By.XPATH, '//button[@id="InitiateConfirmAction"]')
+            wait.until(EC.element_to_be_clickable(confirm_locator)).click()
             _log("EV process initiated successfully.", log_path)
         except Exception as exc:
             _log(f"Warning: Could not confirm EV initiation ({exc}).", log_path)
+        else:
+            try:
+                # The confirmation dialog closes once the request has gone through
+                WebDriverWait(driver, 10).until(EC.invisibility_of_element_located(confirm_locator))
+            except TimeoutException:
+                pass
 
-        time.sleep(3)
         _log("HX upload completed.", log_path)
         return True, "Upload successful and EV process initiated"
 
@@ -188,10 +287,5 @@ def hx_upload(file_path: str, log_path: str = None) -> Tuple[bool, str]:
         message = f"Upload failed: {exc}"
         _log(f"ERROR: {message}", log_path)
         _log(traceback.format_exc(), log_path)
+        _quit_driver()
         return False, message
-    finally:
-        if driver:
-            try:
-                driver.quit()
-            except Exception:
-                pass